@@ -1,54 +1,105 @@
 import logging
-from logging.handlers import RotatingFileHandler, SMTPHandler
 import os
 from flask import Flask
-from app.config import Config
+from app.config import Config, engine_options, replica_binds
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
+from flask_migrate import Migrate
 from flask_mail import Mail
 from flask_bootstrap import Bootstrap
 from flask_moment import Moment
+from app.database import RoutingSession
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
 login = LoginManager()
-login.login_view = "login"
-login.init_app(app)
-mail = Mail(app)
-bootstrap = Bootstrap(app)
-moment = Moment(app)
-
-if not app.debug:
-    root = logging.getLogger()
-    if app.config["MAIL_SERVER"]:
-        auth = None
-        if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
-            auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-        secure = None
-        if app.config['MAIL_USE_TLS']:
-            secure = ()
-        mail_handler = SMTPHandler(
-            mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
-            fromaddr='no-reply@' + app.config['MAIL_SERVER'],
-            toaddrs=app.config['ADMINS'], subject='JobsBD Failure',
-            credentials=auth, secure=secure)
-        mail_handler.setLevel(logging.ERROR)
-        root.addHandler(mail_handler)
-
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/jobsbd.log', maxBytes=10240,
-                                       backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-    root.addHandler(file_handler)
-    root.setLevel(logging.INFO)
-    root.info('JobsBD startup')
-
-
-# You must keep the routes at the end.
-from app import routes, errors
\ No newline at end of file
+login.login_view = "main.login"
+mail = Mail()
+bootstrap = Bootstrap()
+moment = Moment()
+
+
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds(app.config['SQLALCHEMY_REPLICA_URIS']))
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+    login.init_app(app)
+    mail.init_app(app)
+    bootstrap.init_app(app)
+    moment.init_app(app)
+
+    from app import database
+    database.init_app(app, db)
+
+    from app.presence import last_seen_buffer
+    last_seen_buffer.init_app(app)
+
+    from app.security import password_hasher, login_throttle
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
+
+    from app.email import dispatcher
+    dispatcher.init_app(app)
+
+    from app.models import identity_cache
+    identity_cache.init_app(app, 'IDENTITY_CACHE')
+
+    from app.search import facet_cache
+    facet_cache.init_app(app, 'FACET_CACHE')
+
+    from app.reference import reference_data
+    reference_data.init_app(app)
+
+    from app import fragments
+    fragments.init_app(app)
+
+    if app.config['SQL_INSTRUMENTATION']:
+        from app import instrumentation
+        instrumentation.init_app(app, db)
+
+    from app.routes import bp as main_bp
+    app.register_blueprint(main_bp)
+
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp)
+
+    from app.errors import bp as errors_bp
+    app.register_blueprint(errors_bp)
+
+    from app.cli import bp as cli_bp
+    app.register_blueprint(cli_bp)
+
+    if not app.debug and not app.testing:
+        from logging.handlers import RotatingFileHandler, SMTPHandler
+        root = logging.getLogger()
+        if app.config["MAIL_SERVER"]:
+            auth = None
+            if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
+                auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+            secure = None
+            if app.config['MAIL_USE_TLS']:
+                secure = ()
+            mail_handler = SMTPHandler(
+                mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
+                fromaddr='no-reply@' + app.config['MAIL_SERVER'],
+                toaddrs=app.config['ADMINS'], subject='JobsBD Failure',
+                credentials=auth, secure=secure)
+            mail_handler.setLevel(logging.ERROR)
+            root.addHandler(mail_handler)
+
+        if not os.path.exists('logs'):
+            os.mkdir('logs')
+        file_handler = RotatingFileHandler('logs/jobsbd.log', maxBytes=10240,
+                                           backupCount=10)
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+        file_handler.setLevel(logging.INFO)
+        root.addHandler(file_handler)
+        root.setLevel(logging.INFO)
+        root.info('JobsBD startup')
+
+    return app
@@ -0,0 +1,141 @@
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context, url_for
+
+from app import search
+from app.decorators import read_only, statement_timeout
+from app.loaders import with_profile
+from app.models import Job
+from app.pagination import InvalidCursor, keyset_paginate
+from app.reference import reference_data
+
+
+API_PREFIX = '/api/v1'
+
+bp = Blueprint('api', __name__, url_prefix=API_PREFIX)
+
+_BOOLEANS = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+
+
+class ApiError(Exception):
+    status_code = 400
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+
+
+@bp.errorhandler(ApiError)
+def api_error(error):
+    return jsonify({'error': error.message}), error.status_code
+
+
+def _int_arg(name, minimum=0):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError('{} must be an integer'.format(name))
+    if value < minimum:
+        raise ApiError('{} must be at least {}'.format(name, minimum))
+    return value
+
+
+def _filters():
+    available = request.args.get('available')
+    if available is not None and available.lower() not in _BOOLEANS:
+        raise ApiError('available must be true or false')
+    filters = {
+        'terms': search.normalize_terms(request.args.get('q')),
+        'company': request.args.get('company') or None,
+        'location': _int_arg('location', 1),
+        'category': _int_arg('category', 1),
+        'available': _BOOLEANS[available.lower()] if available is not None else None,
+        'min_salary': _int_arg('min_salary'),
+        'max_salary': _int_arg('max_salary'),
+    }
+    if filters['min_salary'] is not None and filters['max_salary'] is not None \
+            and filters['max_salary'] < filters['min_salary']:
+        raise ApiError('max_salary must not be below min_salary')
+    return filters
+
+
+def _timestamp(value):
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+def serialize_job(job):
+    company = job.publisher
+    return {
+        'id': job.id,
+        'title': job.title,
+        'description': job.description,
+        'requirement': job.requirement,
+        'salary': job.salary,
+        'available': job.available,
+        'location': {'id': job.location_id, 'name': reference_data.location(job.location_id)},
+        'category': {'id': job.category_id, 'name': reference_data.category(job.category_id)},
+        'company': {'username': company.username, 'name': company.name} if company else None,
+        'created_at': _timestamp(job.created_at),
+        'updated_at': _timestamp(job.updated_at),
+        'url': url_for('main.job', id=job.id, _external=True),
+    }
+
+
+@bp.route('/jobs')
+@read_only
+@statement_timeout('SEARCH_STATEMENT_TIMEOUT')
+def api_jobs():
+    """Search jobs with the filters of the HTML search, a page at a time.
+
+    ``next_cursor``/``prev_cursor`` go back in as ``after``/``before``.
+    """
+    filters = _filters()
+    sort = request.args.get('sort', 'relevance')
+    if sort not in dict(search.SORT_ORDERS):
+        raise ApiError('sort must be one of {}'.format(', '.join(dict(search.SORT_ORDERS))))
+    limit = min(_int_arg('limit', 1) or current_app.config['JOBS_PER_PAGE'], current_app.config['JOBS_MAX_PER_PAGE'])
+
+    query = search.filter_jobs(with_profile(Job.query, 'job_export'), filters)
+    query, keys = search.search_jobs(query, filters['terms'], sort)
+    try:
+        page = keyset_paginate(query, keys, limit,
+                               after=request.args.get('after'), before=request.args.get('before'))
+    except InvalidCursor:
+        raise ApiError('invalid cursor')
+
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+    return jsonify({
+        'data': [serialize_job(job) for job in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'links': {
+            'next': url_for('api.api_jobs', after=page.next_cursor, **args) if page.has_next else None,
+            'prev': url_for('api.api_jobs', before=page.prev_cursor, **args) if page.has_prev else None,
+        },
+    })
+
+
+@bp.route('/jobs/export')
+@read_only
+def api_jobs_export():
+    """Stream every matching job as newline-delimited JSON, in id order.
+
+    Rows are fetched ``API_EXPORT_BATCH_SIZE`` at a time (a server-side
+    cursor on PostgreSQL) and written as they arrive, so memory use does
+    not grow with the catalogue.
+    """
+    filters = _filters()
+    query = search.filter_jobs(with_profile(Job.query, 'job_export'), filters)
+    query, _, _ = search.match_jobs(query, filters['terms'])
+    query = query.order_by(Job.id).yield_per(current_app.config['API_EXPORT_BATCH_SIZE'])
+
+    def generate():
+        for job in query:
+            yield json.dumps(serialize_job(job), separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,105 @@
+import threading
+
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import text
+
+from app import db, search
+from app.database import pool_metrics
+from app.email import dispatcher, send_email
+from app.job_import import detect_format, import_jobs
+from app.models import Company
+
+
+bp = Blueprint('cli', __name__, cli_group=None)
+
+
+@bp.cli.group('search')
+def search_cli():
+    """Full-text search index maintenance."""
+
+
+@search_cli.command('reindex')
+def reindex():
+    """Rebuild the search document of every job."""
+    count = search.reindex_all()
+    db.session.commit()
+    click.echo(f'Reindexed {count} jobs.')
+
+
+@bp.cli.group('jobs')
+def jobs_cli():
+    """Job catalogue maintenance."""
+
+
+@jobs_cli.command('import')
+@click.argument('company')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='File format; guessed from the extension by default.')
+@click.option('--batch-size', type=int, help='Rows per INSERT/COPY batch.')
+@click.option('--dry-run', is_flag=True, help='Validate the file without saving anything.')
+def jobs_import(company, path, fmt, batch_size, dry_run):
+    """Import the jobs in a CSV or JSONL file for the company COMPANY (its username)."""
+    publisher = Company.query.filter_by(username=company).first()
+    if publisher is None:
+        raise click.BadParameter(f'no company with username {company!r}', param_hint='COMPANY')
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.BadParameter('cannot tell the format from the file name, pass --format', param_hint='PATH')
+
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = import_jobs(publisher, stream, fmt, batch_size=batch_size, dry_run=dry_run)
+    for error in report.errors:
+        click.echo(f'line {error.line}: {error.message}', err=True)
+    verb = 'Validated' if dry_run else 'Imported'
+    click.echo(f'{verb} {report.imported} jobs in {report.elapsed:.2f}s ({report.rate:.0f} rows/s), '
+               f'{report.rejected} rejected.')
+
+
+@bp.cli.group('mail')
+def mail_cli():
+    """Outgoing mail delivery."""
+
+
+@mail_cli.command('test')
+@click.argument('recipients', nargs=-1, required=True)
+@click.option('--count', default=1, help='Number of messages per recipient.')
+def mail_test(recipients, count):
+    """Push test messages through the delivery pool and report its metrics."""
+    for i in range(count):
+        for recipient in recipients:
+            send_email(f'[JobsBD] Test message {i + 1}', sender=current_app.config['ADMINS'][0],
+                       recipients=[recipient], text_body='Test message.',
+                       html_body='<p>Test message.</p>')
+    dispatcher.join()
+    for key, value in dispatcher.stats().items():
+        click.echo(f'{key}: {value}')
+
+
+@bp.cli.group('pool')
+def pool_cli():
+    """Database connection pool."""
+
+
+@pool_cli.command('test')
+@click.option('--threads', default=20, help='Concurrent sessions.')
+@click.option('--queries', default=50, help='Queries per session.')
+def pool_test(threads, queries):
+    """Run queries from many threads at once and report connection waits."""
+    app = current_app._get_current_object()
+
+    def work():
+        with app.app_context():
+            for _ in range(queries):
+                db.session.execute(text('SELECT 1'))
+                db.session.commit()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for key, value in pool_metrics.stats().items():
+        click.echo(f'{key}: {value}')
+    click.echo(f'pool: {db.engine.pool.status()}')
@@ -0,0 +1,74 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from flask import current_app
+
+from app import db
+
+
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+
+
+def compress(text, method='zlib', min_size=256):
+    """Encode ``text`` as a one-byte codec header followed by the payload.
+
+    Values shorter than ``min_size`` bytes, or that do not shrink, are kept
+    raw. ``zstd`` falls back to zlib when zstandard is not installed.
+    """
+    data = text.encode('utf-8')
+    if method in ('zlib', 'zstd') and len(data) >= min_size:
+        if method == 'zstd' and zstandard is not None:
+            packed = ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            packed = ZLIB + zlib.compress(data, 6)
+        if len(packed) <= len(data):
+            return packed
+    return RAW + data
+
+
+def decompress(blob):
+    # Rows written before the column became binary come back as text on SQLite.
+    if isinstance(blob, str):
+        return blob
+    blob = bytes(blob)
+    header, data = blob[:1], blob[1:]
+    if header == RAW:
+        return data.decode('utf-8')
+    if header == ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+    if header == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard must be installed to read zstd-compressed values')
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise ValueError('Unknown compression header {!r}'.format(header))
+
+
+class CompressedText(db.TypeDecorator):
+    """Text kept in a binary column, compressed as ``app.config[config_key]`` says.
+
+    Every value carries its own header, so the setting ('none', 'zlib' or
+    'zstd') can change at any time without rewriting existing rows.
+    """
+
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def __init__(self, config_key, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config_key = config_key
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(value, current_app.config[self.config_key], current_app.config[self.config_key + '_MIN_SIZE'])
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress(value)
@@ -0,0 +1,52 @@
+import hashlib
+from datetime import timezone
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from app.reference import reference_data
+
+
+class Freshness(object):
+    """Validators for a page whose content is fixed by a few version stamps.
+
+    The ETag hashes the stamps together with the viewer, since the navbar
+    and action links differ per account, and the reference data version.
+    :meth:`respond` answers a matching ``If-None-Match`` with a 304 before
+    the page is rendered. ``If-Modified-Since`` alone is not trusted: it has
+    one-second resolution and says nothing about the viewer or the reference
+    data, and every response carries an ETag anyway.
+    """
+
+    def __init__(self, *stamps):
+        self.last_modified = max((s for s in stamps if s is not None), default=None)
+        if self.last_modified is not None:
+            self.last_modified = self.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        self.viewer = current_user.get_id() if current_user.is_authenticated else None
+        parts = [current_app.config['HTTP_CACHE_VERSION'], self.viewer or '',
+                 repr(reference_data.snapshot.version)]
+        parts.extend(s.isoformat() if hasattr(s, 'isoformat') else str(s) for s in stamps)
+        self.etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def not_modified(self):
+        # Pending flashes are shown once, so the page has to be rendered.
+        if session.get('_flashes'):
+            return False
+        return request.if_none_match.contains_weak(self.etag)
+
+    def respond(self, render):
+        if self.not_modified():
+            response = make_response('', 304)
+        else:
+            response = make_response(render())
+        response.set_etag(self.etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        response.vary.add('Cookie')
+        if self.viewer is None and not session.modified:
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+        else:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
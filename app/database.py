@@ -0,0 +1,193 @@
+import logging
+import random
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import QueuePool
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics(object):
+    """Process-wide totals of how long requests waited for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max': self.wait_max,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that times every checkout into :data:`pool_metrics`."""
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            pool_metrics.record(wait, timed_out)
+            if has_app_context():
+                g.db_pool_wait = g.get('db_pool_wait', 0.0) + wait
+                if wait > current_app.config['DB_POOL_WAIT_WARNING']:
+                    logger.warning('Waited %.3fs for a database connection (%s)', wait, self.status())
+
+
+class ReplicaRouter(object):
+    """Picks a replica bind for views marked ``@read_only``.
+
+    The primary is used instead once the request has written anything, for
+    ``REPLICA_STICKY_SECONDS`` after a request by the same client wrote, and
+    whenever no replica is within ``REPLICA_MAX_LAG`` seconds of it. Lag is
+    measured at most every ``REPLICA_LAG_CHECK_INTERVAL`` seconds per replica.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.keys = [key for key in app.config['SQLALCHEMY_BINDS'] if key.startswith('replica')]
+        self.max_lag = app.config['REPLICA_MAX_LAG']
+        self.check_interval = app.config['REPLICA_LAG_CHECK_INTERVAL']
+        self.sticky = app.config['REPLICA_STICKY_SECONDS']
+        with self._lock:
+            self._health = {}
+
+    def choose(self, engines):
+        if not self.keys or not has_request_context() or not g.get('read_only') or g.get('db_wrote'):
+            return None
+        last_write = http_session.get('_db_last_write')
+        if last_write and time.time() - last_write < self.sticky:
+            return None
+        if 'db_replica' not in g:
+            healthy = [key for key in self.keys if self._healthy(key, engines[key])]
+            g.db_replica = random.choice(healthy) if healthy else None
+        return engines[g.db_replica] if g.db_replica else None
+
+    def lag(self, engine):
+        if engine.dialect.name != 'postgresql':
+            return 0.0
+        with engine.connect() as connection:
+            return connection.execute(text(
+                'SELECT CASE WHEN NOT pg_is_in_recovery() '
+                'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')).scalar() or 0.0
+
+    def _healthy(self, key, engine):
+        now = time.monotonic()
+        checked, healthy = self._health.get(key, (None, False))
+        if checked is not None and now - checked < self.check_interval:
+            return healthy
+        with self._lock:
+            checked, healthy = self._health.get(key, (None, False))
+            if checked is not None and now - checked < self.check_interval:
+                return healthy
+            try:
+                lag = self.lag(engine)
+                healthy = lag <= self.max_lag
+                if not healthy:
+                    logger.warning('Replica %s is %.1fs behind, reading from the primary', key, lag)
+            except exc.SQLAlchemyError:
+                logger.exception('Replica %s is unreachable, reading from the primary', key)
+                healthy = False
+            self._health[key] = (now, healthy)
+            return healthy
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """Sends reads in ``@read_only`` views to a replica; see :class:`ReplicaRouter`."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                _wrote()
+            else:
+                replica = replica_router.choose(self._db.engines)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _wrote(*args):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _set_statement_timeout(session, timeout):
+    if session.get_bind().dialect.name == 'postgresql':
+        # SET LOCAL ends with the transaction, which also keeps it safe
+        # behind PgBouncer in transaction pooling mode.
+        session.execute(text('SET LOCAL statement_timeout = {:d}'.format(int(timeout))))
+
+
+def set_statement_timeout(session, timeout):
+    """Limit statements in this request to ``timeout`` milliseconds.
+
+    Applies to the open transaction, if any, and to every transaction the
+    request begins after it.
+    """
+    g.statement_timeout = timeout
+    if session.in_transaction():
+        _set_statement_timeout(session, timeout)
+
+
+def _after_begin(session, transaction, connection):
+    if has_request_context() and g.get('statement_timeout'):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SET LOCAL statement_timeout = {:d}'.format(int(g.statement_timeout))))
+
+
+def is_statement_timeout(error):
+    # 57014 is PostgreSQL's query_canceled.
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '57014'
+
+
+def _after_request(response):
+    if replica_router.keys and g.get('db_wrote'):
+        http_session['_db_last_write'] = int(time.time())
+    wait = g.get('db_pool_wait')
+    if wait is not None:
+        response.headers.add('Server-Timing', 'db-pool;dur={:.2f};desc="connection wait"'.format(wait * 1000))
+    return response
+
+
+def init_app(app, db):
+    replica_router.init_app(app)
+    if not event.contains(db.session, 'after_begin', _after_begin):
+        event.listen(db.session, 'after_begin', _after_begin)
+        event.listen(db.session, 'after_flush', _wrote)
+    app.after_request(_after_request)
@@ -1,7 +1,10 @@
-from flask import redirect, url_for
+from flask import abort, current_app, g
 from functools import wraps
 
 from flask_login import current_user
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.database import is_statement_timeout, set_statement_timeout
 from app.models import User, Company, session
 
 
@@ -12,9 +15,33 @@ def user_permission_required(func):
         if type == 'user':
             return func(*args, **kwargs)
         else:
-            return redirect(url_for('404'))
+            abort(404)
     return wrapper
 
+def read_only(func):
+    """Let the view read from a replica; anything it writes still goes to the primary."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return func(*args, **kwargs)
+    return wrapper
+
+def statement_timeout(config_key):
+    """Cancel the view's queries after ``app.config[config_key]`` milliseconds and answer 503."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            set_statement_timeout(db.session(), current_app.config[config_key])
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_statement_timeout(e):
+                    raise
+                db.session.rollback()
+                abort(503)
+        return wrapper
+    return decorator
+
 def company_permission_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -22,5 +49,5 @@ def company_permission_required(func):
         if type == 'company':
             return func(*args, **kwargs)
         else:
-            return redirect(url_for('404'))
+            abort(404)
     return wrapper
\ No newline at end of file
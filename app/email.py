@@ -1,25 +1,200 @@
-from threading import Thread
-from flask import render_template
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from smtplib import SMTPException, SMTPRecipientsRefused, SMTPSenderRefused, SMTPDataError
+from flask import current_app, render_template
 from flask_mail import Message
-from app import app, mail
+from app import mail
 
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Failures tied to one message; anything else is treated as a broken
+# connection and the rest of the batch is retried.
+_PERMANENT = (SMTPRecipientsRefused, SMTPSenderRefused, SMTPDataError)
+
+
+def _is_permanent(error):
+    # A 4xx reply to DATA (greylisting, a full spool) is transient and goes
+    # through the same backoff as a dropped connection.
+    if isinstance(error, SMTPDataError):
+        return error.smtp_code >= 500
+    return True
+
+
+class MailDispatcher(object):
+    """Delivers mail from a bounded queue with a fixed pool of workers.
+
+    Each worker drains up to ``MAIL_BATCH_SIZE`` queued messages and sends
+    them over a single SMTP connection, retrying connection failures with
+    exponential backoff. When the queue is full, :meth:`submit` waits up to
+    ``MAIL_ENQUEUE_TIMEOUT`` seconds and then rejects the message.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._workers = []
+        self._pid = None
+        self._registered = False
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['MAIL_QUEUE_SIZE'])
+        if not self._registered:
+            atexit.register(self.shutdown)
+            self._registered = True
+
+    def submit(self, msg):
+        self._ensure_workers()
+        try:
+            self._queue.put((msg, time.monotonic()), timeout=self.app.config['MAIL_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            with self._metrics_lock:
+                self.rejected += 1
+            logger.error('Mail queue full, dropping message %r to %s', msg.subject, msg.recipients)
+            return False
+        return True
+
+    def join(self):
+        self._queue.join()
+
+    def shutdown(self, timeout=None):
+        if not self._workers or self._pid != os.getpid():
+            return
+        timeout = self.app.config['MAIL_SHUTDOWN_TIMEOUT'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        for _ in self._workers:
+            try:
+                self._queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        self._workers = []
+
+    def stats(self):
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize() if self._queue else 0,
+                'sent': self.sent,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'retries': self.retries,
+                'latency_avg': self._latency_total / self.sent if self.sent else 0.0,
+                'latency_max': self._latency_max,
+            }
+
+    def _ensure_workers(self):
+        if self._workers and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._workers = [
+                threading.Thread(target=self._run, name='mail-worker-{}'.format(i), daemon=True)
+                for i in range(self.app.config['MAIL_WORKERS'])]
+            for worker in self._workers:
+                worker.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            while len(batch) < self.app.config['MAIL_BATCH_SIZE']:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            size = len(batch)
+            try:
+                self._deliver(batch)
+            except Exception:
+                logger.exception('Mail worker failed on a batch of %d messages', size)
+            finally:
+                for _ in range(size):
+                    self._queue.task_done()
+
+    def _deliver(self, batch):
+        attempt = 0
+        with self.app.app_context():
+            while batch:
+                try:
+                    with mail.connect() as connection:
+                        while batch:
+                            msg, enqueued = batch[0]
+                            try:
+                                connection.send(msg)
+                            except _PERMANENT as e:
+                                if not _is_permanent(e):
+                                    raise
+                                logger.exception('Could not deliver %r to %s', msg.subject, msg.recipients)
+                                self._record_failure()
+                            else:
+                                self._record_sent(time.monotonic() - enqueued)
+                            batch.pop(0)
+                except (SMTPException, OSError):
+                    attempt += 1
+                    if attempt > self.app.config['MAIL_MAX_RETRIES']:
+                        logger.exception('Giving up on %d messages after %d attempts', len(batch), attempt)
+                        for _ in batch:
+                            self._record_failure()
+                        return
+                    with self._metrics_lock:
+                        self.retries += 1
+                    time.sleep(self.app.config['MAIL_RETRY_BACKOFF'] * 2 ** (attempt - 1))
+
+    def _record_sent(self, latency):
+        with self._metrics_lock:
+            self.sent += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _record_failure(self):
+        with self._metrics_lock:
+            self.failed += 1
+
+
+dispatcher = MailDispatcher()
 
 
 def send_email(subject, sender, recipients, text_body, html_body):
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
-    Thread(target=send_async_email, args=(app, msg)).start()
+    return dispatcher.submit(msg)
 
 
 def send_password_reset_email(user):
+    """Queue the reset mail; False when the mail queue rejected it."""
     token = user.get_reset_password_token()
-    send_email('[JobsBD] Reset Your Password',
-               sender=app.config['ADMINS'][0],
+    return send_email('[JobsBD] Reset Your Password',
+               sender=current_app.config['ADMINS'][0],
                recipients=[user.email],
                text_body=render_template('email/reset_password.txt.j2',
                                          user=user, token=token),
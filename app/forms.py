@@ -1,7 +1,10 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, SearchField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length
-from app.models import User, Company
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField, SearchField, IntegerField, RadioField
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional, NumberRange
+from app.models import User, Company, JobApplicationStatus
+from app.search import SORT_ORDERS
+from app.reference import reference_data
 
 
 class LoginForm(FlaskForm):
@@ -96,23 +99,49 @@ class CompanyRegistrationForm(FlaskForm):
         
 class JobSearchForm(FlaskForm):
     search = SearchField("Job title, keyword or company")
-    job_location = SelectField('Location', choices=[('All', 'All Locations'), ('1', 'Hong Kong Island'), ('2', 'Kowloon Peninsula'), ('3', 'New Territory'), ('4', 'Oversea')])
-    job_category = SelectField('Category', choices=[('All', 'All Job Categories'), ('1', 'Information Technology'), ('2', 'Engineering'), ('3','Education'),('4', 'Management'),('5', 'Finance') ,('6', 'Healthcare'),('7', 'Transportation')])
+    job_location = SelectField('Location', default='All')
+    job_category = SelectField('Category', default='All')
+    min_salary = IntegerField('Minimum salary (HKD)', validators=[Optional(), NumberRange(min=0)])
+    max_salary = IntegerField('Maximum salary (HKD)', validators=[Optional(), NumberRange(min=0)])
+    available = SelectField('Availability', choices=[('All', 'Any'), ('yes', 'Still available'), ('no', 'Closed')], default='All')
+    sort = SelectField('Sort by', choices=SORT_ORDERS, default='relevance')
     # job_location = SelectField('Location', choices=[('', 'All Locations'), ('Hong Kong Island', 'Hong Kong Island'), ('Kowloon Peninsula', 'Kowloon Peninsula'), ('New Territory', 'New Territory'), ('Oversea', 'Oversea')])
     # job_category = SelectField('Category', choices=[('', 'All Job Categories'), ('Information Technology', 'Information Technology'), ('Engineering', 'Engineering'), ('Education','Education'),('Management', 'Management'),('Finance', 'Finance') ,('Healthcare', 'Healthcare'),('Transportation', 'Transportation')])
     submit = SubmitField("Search")
 
+    def __init__(self, *args, **kwargs):
+        super(JobSearchForm, self).__init__(*args, **kwargs)
+        self.job_location.choices = [('All', 'All Locations')] + reference_data.location_choices()
+        self.job_category.choices = [('All', 'All Job Categories')] + reference_data.category_choices()
+
+    def validate_max_salary(self, max_salary):
+        if self.min_salary.data is not None and max_salary.data is not None \
+                and max_salary.data < self.min_salary.data:
+            raise ValidationError("Maximum salary must not be below the minimum.")
+
 class JobForm(FlaskForm):
     title = StringField('Job Title')
     description = TextAreaField('Job Description')
     requirement = TextAreaField('Job Requirement')
-    salary = StringField('Job Salary')
+    salary = IntegerField('Job Salary', validators=[Optional(), NumberRange(min=0, max=10000000)])
     available = BooleanField('still available?')
 
-    location = SelectField('Location', choices=[('1', 'Hong Kong Island'), ('2', 'Kowloon Peninsula'), ('3', 'New Territory'), ('4', 'Oversea')])
-    category = SelectField('Category', choices=[('1', 'Information Technology'), ('2', 'Engineering'), ('3','Education'),('4', 'Management'),('5', 'Finance') ,('6', 'Healthcare'),('7', 'Transportation')])
+    location = SelectField('Location')
+    category = SelectField('Category')
     submit = SubmitField("Submit")
 
+    def __init__(self, *args, **kwargs):
+        super(JobForm, self).__init__(*args, **kwargs)
+        self.location.choices = reference_data.location_choices()
+        self.category.choices = reference_data.category_choices()
+
+
+class JobImportForm(FlaskForm):
+    file = FileField('Jobs file (CSV or JSON Lines)', validators=[
+        FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], 'Upload a .csv or .jsonl file.')])
+    dry_run = BooleanField('Only check the file')
+    submit = SubmitField('Import')
+
 
 class CompanyEditForm(FlaskForm):
     username = StringField("Username", validators=[DataRequired()])
@@ -142,4 +171,20 @@ class JobApplyForm(FlaskForm):
 class JobReplyForm(FlaskForm):
     reply = TextAreaField("Your Reply", validators=[DataRequired()])
     status = SelectField('Change Status', choices=[('Submitted', 'Submitted'), ('Reviewed', 'Reviewed'), ('Interview', 'Interview'), ('Offered', 'Offered'), ('Rejected', 'Rejected')])
-    submit = SubmitField("Edit")
\ No newline at end of file
+    submit = SubmitField("Edit")
+
+class ApplicationBulkForm(FlaskForm):
+    scope = RadioField('Apply to', choices=[('selected', 'The selected applications'),
+                                             ('matching', 'Every application matching the filter')],
+                       default='selected')
+    job = SelectField('Job', default='All')
+    status = SelectField('Current status', default='All',
+                         choices=[('All', 'Any status')] + [(s.value, s.value) for s in JobApplicationStatus])
+    new_status = SelectField('Move to', choices=[(s.value, s.value) for s in JobApplicationStatus])
+    reply = TextAreaField('Reply to every applicant (optional)')
+    preview = SubmitField('Count')
+    submit = SubmitField('Apply')
+
+    def __init__(self, jobs=(), *args, **kwargs):
+        super(ApplicationBulkForm, self).__init__(*args, **kwargs)
+        self.job.choices = [('All', 'Any job')] + [(str(id), title) for id, title in jobs]
@@ -0,0 +1,72 @@
+import time
+
+from flask import g, has_request_context, request
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.cache import TTLCache
+
+
+fragment_cache = TTLCache()
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache 'job-row', job.id, job.updated_at %}...{% endcache %}``
+
+    Stores the rendered block in :data:`fragment_cache` under the template
+    name plus the given key parts, which must change whenever anything the
+    block displays does.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        key = nodes.Tuple([nodes.Const(parser.name)] + parts, 'load')
+        return nodes.CallBlock(self.call_method('_cached', [key]), [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, caller):
+        if has_request_context():
+            key = (request.script_root,) + key
+        stats = _request_stats()
+        html = fragment_cache.get(key)
+        if html is not None:
+            if stats is not None:
+                stats[0] += 1
+            return html
+        started = time.perf_counter()
+        html = Markup(caller())
+        fragment_cache.set(key, html)
+        if stats is not None:
+            stats[1] += 1
+            stats[2] += time.perf_counter() - started
+        return html
+
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    stats = g.get('fragment_stats')
+    if stats is None:
+        stats = g.fragment_stats = [0, 0, 0.0]
+    return stats
+
+
+def add_fragment_timing(response):
+    stats = g.get('fragment_stats')
+    if stats is not None:
+        hits, misses, duration = stats
+        response.headers.add('Server-Timing', 'fragments;dur={:.2f};desc="{} hits, {} misses"'.format(
+            duration * 1000, hits, misses))
+    return response
+
+
+def init_app(app):
+    fragment_cache.init_app(app, 'FRAGMENT_CACHE')
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.after_request(add_fragment_timing)
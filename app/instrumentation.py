@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+from app.database import pool_metrics
+
+
+logger = logging.getLogger('jobsbd.sql')
+
+_NORMALIZERS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|(?<!:):\w+|\$\d+|\?'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?, ...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(statement):
+    for pattern, replacement in _NORMALIZERS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(normalize(statement).encode('utf-8')).hexdigest()[:12]
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.samples = {}
+
+    def record(self, statement, duration):
+        key = fingerprint(statement)
+        self.count += 1
+        self.duration += duration
+        self.statements[key] += 1
+        self.samples.setdefault(key, normalize(statement))
+
+    def repeated(self, threshold):
+        return [(key, n, self.samples[key]) for key, n in self.statements.most_common() if n >= threshold]
+
+
+def current_stats():
+    if not has_app_context():
+        return None
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = RequestStats()
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+def _before_request():
+    g.sql_stats = RequestStats()
+
+
+def _after_request(response):
+    stats = g.get('sql_stats')
+    if stats is None:
+        return response
+    duration_ms = stats.duration * 1000
+    response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(duration_ms, stats.count))
+    response.headers['X-DB-Query-Count'] = str(stats.count)
+
+    suspects = stats.repeated(current_app.config['SQL_INSTRUMENTATION_REPEAT_THRESHOLD'])
+    # Process totals, so pool pressure shows up next to the requests causing it.
+    pool = pool_metrics.stats()
+    logger.info('%s %s %s queries=%d db=%.2fms distinct=%d '
+                'pool_checkouts=%d pool_timeouts=%d pool_wait_avg=%.2fms pool_wait_max=%.2fms%s',
+                request.method, request.path, response.status_code,
+                stats.count, duration_ms, len(stats.statements),
+                pool['checkouts'], pool['timeouts'], pool['wait_avg'] * 1000, pool['wait_max'] * 1000,
+                ''.join('\n    repeated x{} [{}] {}'.format(n, key, sample[:300])
+                        for key, n, sample in suspects))
+    return response
+
+
+def init_app(app, db):
+    """Hook statement timing into every engine of ``db``.
+
+    Off unless ``SQL_INSTRUMENTATION`` is set, since timing every cursor
+    execution costs a little on each query.
+    """
+    log_file = app.config['SQL_INSTRUMENTATION_LOG']
+    if log_file and not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.mkdir(log_dir)
+        handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=10)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,232 @@
+import csv
+import io
+import json
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, text
+
+from app import db, search
+from app.models import Job
+from app.reference import reference_data
+
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+REQUIRED_COLUMNS = ('title', 'description', 'requirement', 'location', 'category')
+
+MAX_SALARY = 10000000
+
+_BOOLEANS = {'': True, 'true': True, 'yes': True, 'y': True, '1': True,
+             'false': False, 'no': False, 'n': False, '0': False}
+
+RowError = namedtuple('RowError', 'line message')
+
+
+class ImportReport(object):
+    def __init__(self, max_errors=1000):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(RowError(line, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rate(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(filename):
+    for suffix, fmt in FORMATS.items():
+        if filename.lower().endswith(suffix):
+            return fmt
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line, row, error)`` for each record of a CSV or JSONL text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [name for name in REQUIRED_COLUMNS if name not in (reader.fieldnames or ())]
+        if missing:
+            yield 1, None, 'missing columns: {}'.format(', '.join(missing))
+            return
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line, data in enumerate(stream, 1):
+            if not data.strip():
+                continue
+            try:
+                row = json.loads(data)
+            except ValueError as e:
+                yield line, None, 'invalid JSON: {}'.format(e)
+                continue
+            if not isinstance(row, dict):
+                yield line, None, 'expected a JSON object'
+                continue
+            yield line, row, None
+
+
+def _lookup(mapping):
+    # Reference rows may be given by id or by (case-insensitive) name.
+    names = {name.lower(): id for id, name in mapping.items()}
+
+    def lookup(value):
+        if value.isdigit():
+            return int(value) if int(value) in mapping else None
+        return names.get(value.lower())
+    return lookup
+
+
+def clean_row(row, locations, categories):
+    """Return ``(values, error)`` for one raw record."""
+    values = {}
+    for name in ('title', 'description', 'requirement'):
+        value = row.get(name)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            return None, '{} is required'.format(name)
+        values[name] = value
+    if len(values['title']) > 50:
+        return None, 'title is longer than 50 characters'
+
+    salary = row.get('salary')
+    if salary is None or str(salary).strip() == '':
+        values['salary'] = None
+    else:
+        try:
+            values['salary'] = int(str(salary).strip())
+        except ValueError:
+            return None, 'salary must be a whole number'
+        if not 0 <= values['salary'] <= MAX_SALARY:
+            return None, 'salary must be between 0 and {}'.format(MAX_SALARY)
+
+    for name, lookup in (('location', locations), ('category', categories)):
+        value = str(row.get(name) or '').strip()
+        values[name + '_id'] = lookup(value) if value else None
+        if values[name + '_id'] is None:
+            return None, 'unknown {} {!r}'.format(name, value)
+
+    available = row.get('available')
+    available = str(available).strip().lower() if available is not None else ''
+    if available not in _BOOLEANS:
+        return None, 'available must be yes or no'
+    values['available'] = _BOOLEANS[available]
+    return values, None
+
+
+def _insert_rows(company, rows):
+    now = datetime.utcnow()
+    for values in rows:
+        values.update(company_id=company.id, created_at=now, updated_at=now)
+    result = db.session.execute(
+        insert(Job).returning(Job.id, Job.title, Job.description, Job.requirement), rows)
+    documents = []
+    for job_id, title, description, requirement in result:
+        heading, body = search.document_parts(title, company.name, description, requirement)
+        documents.append({'job_id': job_id, 'heading': heading, 'body': body})
+    search.index_documents(documents)
+
+
+_STAGE_COLUMNS = ('title', 'description', 'requirement', 'salary', 'location_id', 'category_id', 'available')
+
+
+def _copy_rows(company, rows):
+    # COPY has no RETURNING, so rows go through a temporary table and one
+    # INSERT .. SELECT writes the jobs and their search documents together.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in rows:
+        writer.writerow([{True: 't', False: 'f'}.get(values[name], values[name]) if name == 'available'
+                         else values[name] for name in _STAGE_COLUMNS])
+    buffer.seek(0)
+
+    connection = db.session.connection()
+    connection.execute(text(
+        'CREATE TEMPORARY TABLE job_import_stage (title text, description text, requirement text, '
+        'salary integer, location_id integer, category_id integer, available boolean) ON COMMIT DROP'))
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert('COPY job_import_stage ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            ', '.join(_STAGE_COLUMNS)), buffer)
+    finally:
+        cursor.close()
+    connection.execute(text(
+        'WITH new AS ('
+        ' INSERT INTO job (company_id, location_id, category_id, title, description, requirement,'
+        ' salary, available, created_at, updated_at)'
+        ' SELECT :company_id, location_id, category_id, title, description, requirement,'
+        ' salary, available, :now, :now FROM job_import_stage'
+        ' RETURNING id, title, description, requirement)'
+        ' INSERT INTO job_search_document (job_id, heading, body)'
+        ' SELECT id, concat_ws(\' \', title, NULLIF(:company_name, \'\')), concat_ws(chr(10), description, requirement)'
+        ' FROM new'), {'company_id': company.id, 'company_name': company.name, 'now': datetime.utcnow()})
+
+
+def _use_copy():
+    bind = db.session.get_bind()
+    return current_app.config['JOB_IMPORT_USE_COPY'] and bind.dialect.name == 'postgresql' \
+        and bind.dialect.driver == 'psycopg2'
+
+
+def import_jobs(company, stream, fmt, batch_size=None, dry_run=False):
+    """Validate and insert the jobs in ``stream`` for ``company``.
+
+    Records are checked one at a time as they are read and valid ones are
+    written ``JOB_IMPORT_BATCH_SIZE`` at a time, with COPY on PostgreSQL
+    and a multi-row INSERT elsewhere; each batch is committed on its own.
+    Invalid records are skipped and reported with their line number.
+    """
+    batch_size = batch_size or current_app.config['JOB_IMPORT_BATCH_SIZE']
+    report = ImportReport(current_app.config['JOB_IMPORT_MAX_ERRORS'])
+    snapshot = reference_data.snapshot
+    locations, categories = _lookup(snapshot.locations), _lookup(snapshot.categories)
+    write = _copy_rows if _use_copy() else _insert_rows
+    batch, lines = [], []
+
+    def flush():
+        try:
+            write(company, batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Job import batch failed')
+            for line in lines:
+                report.reject(line, 'could not be saved: {}'.format(e.__class__.__name__))
+        else:
+            report.imported += len(batch)
+        del batch[:], lines[:]
+
+    for line, row, error in read_rows(stream, fmt):
+        values = None
+        if error is None:
+            values, error = clean_row(row, locations, categories)
+        if error is not None:
+            report.reject(line, error)
+            continue
+        if dry_run:
+            report.imported += 1
+            continue
+        batch.append(values)
+        lines.append(line)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if report.imported and not dry_run:
+        search.invalidate_facets()
+    return report.finish()
@@ -0,0 +1,47 @@
+from sqlalchemy.orm import joinedload, undefer, undefer_group
+
+from app.models import Job, JobApplication, Post
+
+
+# Loader options per view, so every row a template touches is fetched with
+# the page itself instead of one lazy load per row. The long Text columns
+# are deferred on the models and only the views that show them undefer
+# them. Location and Category labels come from app.reference and need no
+# join.
+PROFILES = {
+    'search_results': lambda: (
+        joinedload(Job.publisher),
+    ),
+    'job_detail': lambda: (
+        joinedload(Job.publisher),
+        undefer(Job.description),
+    ),
+    'job_form': lambda: (
+        joinedload(Job.publisher),
+        undefer_group('body'),
+    ),
+    'job_export': lambda: (
+        joinedload(Job.publisher),
+        undefer_group('body'),
+    ),
+    'company_jobs': lambda: (
+        joinedload(Job.publisher),
+        undefer(Job.description),
+    ),
+    'applications_inbox': lambda: (
+        joinedload(JobApplication.company),
+        joinedload(JobApplication.job),
+    ),
+    'application_detail': lambda: (
+        joinedload(JobApplication.company),
+        joinedload(JobApplication.job),
+        undefer_group('body'),
+    ),
+    'timeline': lambda: (
+        joinedload(Post.author),
+    ),
+}
+
+
+def with_profile(query, name):
+    return query.options(*PROFILES[name]())
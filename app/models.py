@@ -1,12 +1,18 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta, timezone
 from hashlib import md5
-from app import app, db, login
+from flask import current_app
+from app import db, login
+from app.presence import last_seen_buffer
+from app.security import password_hasher
+from app.cache import TTLCache
+from app.compression import CompressedText
 import jwt
 
 from flask_login import UserMixin
+from sqlalchemy.orm import make_transient_to_detached
 
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 
 from flask import session
 
@@ -14,8 +20,8 @@ from enum import Enum
 
 followers = db.Table(
     'followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'), primary_key=True)
 )
 
 
@@ -27,6 +33,8 @@ class User(UserMixin, db.Model):
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     about_me = db.Column(db.String(140))
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    followed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     followed = db.relationship(
         'User', secondary=followers,
         primaryjoin=(followers.c.follower_id == id),
@@ -39,10 +47,14 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self, password)
+
+    @property
+    def last_seen_at(self):
+        return last_seen_buffer.get(self.id, self.last_seen)
 
     def avatar(self, size):
         digest = md5(self.email.lower().encode("utf-8")).hexdigest()
@@ -51,28 +63,64 @@ class User(UserMixin, db.Model):
 
     def follow(self, user):
         if not self.is_following(user):
+            self._backfill_timeline(user)
             self.followed.append(user)
+            self.followed_count = User.followed_count + 1
+            user.followers_count = User.followers_count + 1
 
     def unfollow(self, user):
         if self.is_following(user):
             self.followed.remove(user)
+            self.followed_count = User.followed_count - 1
+            user.followers_count = User.followers_count - 1
+            TimelineEntry.query.filter_by(user_id=self.id, author_id=user.id) \
+                .delete(synchronize_session=False)
+
+    def is_heavy_poster(self):
+        # Posts of widely followed users are pulled at read time instead of
+        # being copied into every follower's timeline; see Post.pulled.
+        return self.followers_count > current_app.config['TIMELINE_FANOUT_LIMIT']
+
+    def _backfill_timeline(self, user):
+        recent = db.select(db.literal(self.id), Post.id, Post.user_id, Post.timestamp) \
+            .where(Post.user_id == user.id, Post.pulled.is_(False)) \
+            .order_by(Post.timestamp.desc()) \
+            .limit(current_app.config['TIMELINE_BACKFILL_LIMIT'])
+        db.session.execute(db.insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], recent))
 
     def is_following(self, user):
-        return self.followed.filter(followers.c.followed_id == user.id).count() > 0
+        return user.id in self.following_among([user])
+
+    def following_among(self, users):
+        """Return the ids of ``users`` this user follows, in one query."""
+        ids = [user.id for user in users]
+        if not ids:
+            return set()
+        return set(db.session.scalars(
+            db.select(followers.c.followed_id).where(
+                followers.c.follower_id == self.id,
+                followers.c.followed_id.in_(ids))))
 
     def followed_posts(self):
-        followed = Post.query.join(
-            followers, followers.c.followed_id == Post.user_id
-        ).filter(followers.c.follower_id == self.id)
-        own = Post.query.filter_by(user_id=self.id)
-        return followed.union(own).order_by(Post.timestamp.desc())
+        timeline = Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id) \
+            .filter(TimelineEntry.user_id == self.id)
+
+        # Decided per post when it was written, so posts stay visible when the
+        # author's follower count later crosses the limit either way.
+        pulled = Post.query.join(followers, followers.c.followed_id == Post.user_id) \
+            .filter(followers.c.follower_id == self.id, Post.pulled.is_(True))
+        if not db.session.query(pulled.exists()).scalar():
+            return timeline.order_by(TimelineEntry.timestamp.desc())
+
+        return timeline.union(pulled).order_by(Post.timestamp.desc())
 
     def get_reset_password_token(self, expires_in=600, is_company=True):
         if not is_company:
             raise ValueError("Incorrect class type")
         return jwt.encode({"reset_password": self.id,
                            "exp": datetime.now(tz=timezone.utc) + timedelta(seconds=expires_in)},
-                          app.config["SECRET_KEY"], algorithm="HS256")
+                          current_app.config["SECRET_KEY"], algorithm="HS256")
     
     # ------------------------------------------------------------------------------------------------------------
     def get_id(self):
@@ -83,7 +131,7 @@ class User(UserMixin, db.Model):
     @staticmethod
     def verify_reset_password_token(token):
         try:
-            id = jwt.decode(token, app.config["SECRET_KEY"], algorithms="HS256")[
+            id = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms="HS256")[
                 "reset_password"]
         except:           
             return None
@@ -100,25 +148,84 @@ class Post(db.Model):
     body = db.Column(db.String(140))
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # Set when the post was not fanned out and followers read it at read time.
+    pulled = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (
+        db.Index('ix_post_user_pulled', 'user_id', 'pulled'),
+    )
 
     def __repr__(self) -> str:
         return f'<Post {self.body}>'
 
+    def fan_out(self):
+        db.session.add(TimelineEntry(user_id=self.user_id, post_id=self.id,
+                                     author_id=self.user_id, timestamp=self.timestamp))
+        if self.author.is_heavy_poster():
+            self.pulled = True
+            return
+        audience = db.select(followers.c.follower_id, db.literal(self.id),
+                             db.literal(self.user_id), db.literal(self.timestamp)) \
+            .where(followers.c.followed_id == self.user_id)
+        db.session.execute(db.insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], audience))
+
+
+class TimelineEntry(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_timeline_entry_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_timeline_entry_user_author', 'user_id', 'author_id'),
+    )
+
 # /------------------------------------------------------------------------------------------------/#
 
+# Column snapshots of recently authenticated principals, keyed like get_id().
+# Updates only evict the snapshot in the process that made them; every
+# other worker may serve it for up to IDENTITY_CACHE_TTL seconds, so keep
+# that short. Password hashes are never cached and always load fresh.
+identity_cache = TTLCache()
+
+_UNCACHED = frozenset(['password_hash'])
+
+
+def _load_identity(model, uid):
+    key = '{}.{}'.format(model.__tablename__, uid)
+    values = identity_cache.get(key)
+    if values is not None:
+        principal = model(**values)
+        make_transient_to_detached(principal)
+        return db.session.merge(principal, load=False)
+
+    principal = model.query.get(uid)
+    if principal is not None:
+        identity_cache.set(key, {attr.key: getattr(principal, attr.key)
+                                 for attr in db.inspect(model).column_attrs
+                                 if attr.key not in _UNCACHED})
+    return principal
+
+
+def _forget_identity(mapper, connection, target):
+    identity_cache.pop(target.get_id())
+
+
 @login.user_loader
 def load_user(user_id):
     temp = user_id.split('.')
     type = session.get('type')
     try:
-        uid = temp[1]
+        uid = int(temp[1])
         if temp[0] == 'user' or type == 'user':
-            return User.query.get(uid)
+            return _load_identity(User, uid)
         elif temp[0] == 'company' or type == 'company':
-            return Company.query.get(uid)
+            return _load_identity(Company, uid)
         else:
             return None
-    except IndexError:
+    except (IndexError, ValueError):
         return None
 
 # @login.user_loader
@@ -139,21 +246,22 @@ class Company(UserMixin, db.Model):
     name = db.Column(db.String(128), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
     password_hash = db.Column(db.String(128))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     publishes = db.relationship('Job', backref='publisher', lazy='dynamic')
 
     def __repr__(self) -> str:
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self, password)
 
     def get_reset_password_token(self, expires_in=600):
         return jwt.encode({"company_reset_password": self.id,
                            "exp": datetime.now(tz=timezone.utc) + timedelta(seconds=expires_in)},
-                          app.config["SECRET_KEY"], algorithm="HS256")
+                          current_app.config["SECRET_KEY"], algorithm="HS256")
 
     def get_id(self):
         return 'company.' + str(self.id)
@@ -161,7 +269,7 @@ class Company(UserMixin, db.Model):
     @staticmethod
     def verify_reset_password_token(token):
         try:
-            id = jwt.decode(token, app.config["SECRET_KEY"], algorithms="HS256")[
+            id = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms="HS256")[
                 "company_reset_password"]
         except:           
             return None
@@ -169,35 +277,49 @@ class Company(UserMixin, db.Model):
     
     job_application = db.relationship('JobApplication', backref='company', lazy='dynamic')
 
+
+for _principal in (User, Company):
+    db.event.listen(_principal, 'after_update', _forget_identity)
+    db.event.listen(_principal, 'after_delete', _forget_identity)
+
+def insert_missing(column, values):
+    # One INSERT .. ON CONFLICT DO NOTHING instead of a SELECT per value.
+    rows = [{column.key: value} for value in values]
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        existing = set(db.session.scalars(db.select(column).where(column.in_(values))))
+        rows = [row for row in rows if row[column.key] not in existing]
+        if rows:
+            db.session.execute(db.insert(column.table), rows)
+        return
+    db.session.execute(insert(column.table).values(rows).on_conflict_do_nothing(index_elements=[column]))
+
+
 class Location(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    location = db.Column(db.String(50))
+    location = db.Column(db.String(50), unique=True)
     jobs = db.relationship('Job', backref='location')
 
     @staticmethod
     def insert_default_locations():
         locations = ['Hong Kong Island', 'Kowloon Peninsula', 'New Territory', 'Oversea']
-        for location_name in locations:
-            location = Location.query.filter_by(location=location_name).first()
-            if not location:
-                location = Location(location=location_name)
-                db.session.add(location)
+        insert_missing(Location.__table__.c.location, locations)
         db.session.commit()
 
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    category = db.Column(db.String(50))
+    category = db.Column(db.String(50), unique=True)
     jobs = db.relationship('Job', backref='category')
 
     @staticmethod
     def insert_default_categories():
         categories = ['Information Technology','Engineering', 'Education','Management','Finance','Healthcare','Transportation']
-        for category_name in categories:
-            category = Category.query.filter_by(category=category_name).first()
-            if not category:
-                category = Category(category=category_name)
-                db.session.add(category)
+        insert_missing(Category.__table__.c.category, categories)
         db.session.commit()
 
 
@@ -222,20 +344,56 @@ class Job(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
 
     title = db.Column(db.String(50), index=True, nullable=False)
-    description = db.Column(db.Text, nullable=False)
-    requirement = db.Column(db.Text, nullable=False)
+    # Long text is only loaded by the views that show it; see app.loaders.
+    description = db.deferred(db.Column(db.Text, nullable=False), group='body')
+    requirement = db.deferred(db.Column(db.Text, nullable=False), group='body')
     salary = db.Column(db.Integer, nullable=True)
 
     created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     available = db.Column(db.Boolean)
 
+    # Seek pagination of search results walks these with the id as tiebreaker.
+    __table_args__ = (
+        db.Index('ix_job_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_job_salary_id', 'salary', 'id'),
+        # Salary range filters and the per-category histogram.
+        db.Index('ix_job_location_category_salary', 'location_id', 'category_id', 'salary', 'id'),
+        db.Index('ix_job_category_salary', 'category_id', 'salary'),
+    )
+
     # locations = db.relationship('Location', backref='job_in_location')
     # categories = db.relationship('Category', backref='job_in_category')
 
     job_application = db.relationship('JobApplication', backref='job', lazy='dynamic')
 
 
+def search_vector(heading, body):
+    # Must stay identical to the expression the GIN index is built on,
+    # otherwise PostgreSQL falls back to a sequential scan.
+    config = db.literal_column("'english'::regconfig")
+    return db.func.setweight(db.func.to_tsvector(config, db.func.coalesce(heading, '')), 'A').op('||')(
+        db.func.setweight(db.func.to_tsvector(config, db.func.coalesce(body, '')), 'D'))
+
+
+class JobSearchDocument(db.Model):
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id', ondelete='CASCADE'), primary_key=True)
+    heading = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_job_search_document_vector', search_vector(heading, body),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+
+# SQLite has no tsvector, so test databases mirror the documents into an FTS5 table.
+db.event.listen(JobSearchDocument.__table__, 'after_create', db.DDL(
+    'CREATE VIRTUAL TABLE IF NOT EXISTS job_fts USING fts5(heading, body)').execute_if(dialect='sqlite'))
+db.event.listen(JobSearchDocument.__table__, 'after_drop', db.DDL(
+    'DROP TABLE IF EXISTS job_fts').execute_if(dialect='sqlite'))
+
+
 class JobApplicationStatus(Enum):
     submitted = 'Submitted'
     reviewed = 'Reviewed'
@@ -254,16 +412,49 @@ class JobApplication(db.Model):
     name = db.Column(db.String(128), index=True)
     contact_number = db.Column(db.Integer, nullable=False)
     contact_email = db.Column(db.String(120), index=True, nullable=False)
-    resume = db.Column(db.Text, nullable=False)
+    resume = db.deferred(db.Column(CompressedText('RESUME_COMPRESSION'), nullable=False), group='body')
 
-    message = db.Column(db.Text)
-    reply = db.Column(db.Text)
+    message = db.deferred(db.Column(db.Text), group='body')
+    reply = db.deferred(db.Column(db.Text), group='body')
 
     # status = db.Column(db.Enum(JobApplicationStatus), nullable=False)
     status = db.Column(db.String(50), nullable=False, index=True)
 
     created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # The company inbox pages by (created_at, id) and counts by job and status.
+    __table_args__ = (
+        db.Index('ix_job_application_company_created_id', 'company_id', 'created_at', 'id'),
+        db.Index('ix_job_application_company_job_status', 'company_id', 'job_id', 'status'),
+    )
+
+    @staticmethod
+    def inbox_counts(company_id):
+        """``{job_id: {status: count}}`` for a company, from one grouped query."""
+        rows = db.session.query(JobApplication.job_id, JobApplication.status, db.func.count()) \
+            .filter(JobApplication.company_id == company_id) \
+            .group_by(JobApplication.job_id, JobApplication.status)
+        counts = {}
+        for job_id, status, count in rows:
+            counts.setdefault(job_id, {})[status] = count
+        return counts
+
+    @staticmethod
+    def bulk_transition(query, status, reply=None, dry_run=False):
+        """Move the applications in ``query`` to ``status`` with one UPDATE.
+
+        Applications already in ``status`` are left alone unless a reply is
+        given. Returns the number of rows changed, or that would be.
+        """
+        if not reply:
+            query = query.filter(JobApplication.status != status)
+        if dry_run:
+            return query.count()
+        values = {JobApplication.status: status, JobApplication.updated_at: datetime.utcnow()}
+        if reply:
+            values[JobApplication.reply] = reply
+        return query.update(values, synchronize_session=False)
 
     # Relationships
     # job = db.relationship('Job', back_populates='job_application')
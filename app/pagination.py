@@ -0,0 +1,109 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in values]
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def _seek(keys, values, forward):
+    # Rows strictly after (or before, going backwards) the cursor position.
+    descending = {desc for _, desc in keys}
+    if len(descending) == 1:
+        columns = tuple_(*[expr for expr, _ in keys])
+        bound = tuple_(*values)
+        if descending.pop() == forward:
+            return columns < bound
+        return columns > bound
+
+    clauses = []
+    for i, (expr, desc) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if desc == forward else expr > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+class KeysetPage(object):
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, keys, per_page, after=None, before=None):
+    """Seek-paginate ``query`` over ``keys``, a list of ``(expression, descending)``.
+
+    The last key must be unique (usually the primary key) so the order is
+    total. Raises :class:`InvalidCursor` for a tampered ``after``/``before``.
+    """
+    forward = before is None
+    cursor = after if forward else before
+    labels = ['_key_{}'.format(i) for i in range(len(keys))]
+    query = query.add_columns(*[expr.label(label) for (expr, _), label in zip(keys, labels)])
+
+    if cursor:
+        query = query.filter(_seek(keys, decode_cursor(cursor, len(keys)), forward))
+
+    order = []
+    for expr, desc in keys:
+        order.append(expr.desc() if desc == forward else expr.asc())
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def position(row):
+        return encode_cursor([getattr(row, label) for label in labels])
+
+    items = [row[0] for row in rows]
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or not forward:
+            next_cursor = position(rows[-1])
+        if (more and not forward) or (forward and cursor):
+            prev_cursor = position(rows[0])
+    return KeysetPage(items, next_cursor, prev_cursor)
@@ -0,0 +1,100 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+
+class LastSeenBuffer(object):
+    """Collects ``User.last_seen`` bumps in memory and writes them in bulk.
+
+    A user is touched at most once per ``LAST_SEEN_MIN_INTERVAL`` seconds and
+    pending values are flushed every ``LAST_SEEN_FLUSH_INTERVAL`` seconds as
+    one executemany UPDATE, plus once more when the process exits.
+    """
+
+    def __init__(self, app=None):
+        self._pending = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._registered = False
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.min_interval = timedelta(seconds=app.config['LAST_SEEN_MIN_INTERVAL'])
+        self.flush_interval = app.config['LAST_SEEN_FLUSH_INTERVAL']
+        # Once per process; create_app may run many times (tests, CLI, scripts)
+        # and the handler flushes through whichever app came last.
+        if not self._registered:
+            atexit.register(self.flush)
+            self._registered = True
+
+    def touch(self, user_id, stored=None, now=None):
+        now = now or datetime.utcnow()
+        with self._lock:
+            last = self._pending.get(user_id) or self._recent.get(user_id) or stored
+            if last is not None and now - last < self.min_interval:
+                return
+            self._pending[user_id] = now
+            self._recent[user_id] = now
+        self._ensure_worker()
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            buffered = self._pending.get(user_id) or self._recent.get(user_id)
+        if buffered is None or (default is not None and default > buffered):
+            return default
+        return buffered
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            horizon = datetime.utcnow() - self.min_interval
+            self._recent = {k: v for k, v in self._recent.items() if v >= horizon}
+        if not batch:
+            return 0
+
+        from app.models import User
+        try:
+            with self.app.app_context():
+                db.session.execute(update(User), [
+                    {'id': user_id, 'last_seen': seen} for user_id, seen in batch.items()])
+                db.session.commit()
+        except Exception:
+            logger.exception('Could not flush %d last_seen updates', len(batch))
+            with self._lock:
+                for user_id, seen in batch.items():
+                    self._pending.setdefault(user_id, seen)
+            return 0
+        return len(batch)
+
+    def _ensure_worker(self):
+        # Workers forked from a preloaded parent inherit no running thread.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='last-seen-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.flush_interval):
+            self.flush()
+
+
+last_seen_buffer = LastSeenBuffer()
@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Location, Category
+
+
+ReferenceSnapshot = namedtuple('ReferenceSnapshot', 'version locations categories')
+
+
+class ReferenceData(object):
+    """Per-process copy of the Location and Category lookup tables.
+
+    The tables are loaded into read-only mappings and re-read at most
+    every ``REFERENCE_DATA_TTL`` seconds; the mappings are only rebuilt
+    when a digest of the rows has changed, so an unchanged table keeps the
+    same snapshot and version. Writes through the ORM in this process drop
+    the snapshot straight away.
+    """
+
+    def __init__(self, app=None, ttl=300):
+        self.ttl = ttl
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['REFERENCE_DATA_TTL']
+        self.invalidate()
+        app.context_processor(inject_reference_data)
+
+    def _read(self):
+        locations = db.session.execute(select(Location.id, Location.location).order_by(Location.id))
+        categories = db.session.execute(select(Category.id, Category.category).order_by(Category.id))
+        return [tuple(row) for row in locations], [tuple(row) for row in categories]
+
+    @staticmethod
+    def _version(rows):
+        # Stable across processes, since it ends up in ETags; covers renames
+        # as well as inserts and deletes.
+        return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def snapshot(self):
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked < self.ttl:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and now - self._checked < self.ttl:
+                return self._snapshot
+            locations, categories = rows = self._read()
+            version = self._version(rows)
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = ReferenceSnapshot(version,
+                                                   MappingProxyType(dict(locations)),
+                                                   MappingProxyType(dict(categories)))
+            self._checked = now
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def location(self, location_id):
+        return self.snapshot.locations.get(location_id, '')
+
+    def category(self, category_id):
+        return self.snapshot.categories.get(category_id, '')
+
+    def location_choices(self):
+        return [(str(k), v) for k, v in self.snapshot.locations.items()]
+
+    def category_choices(self):
+        return [(str(k), v) for k, v in self.snapshot.categories.items()]
+
+    def seed_defaults(self):
+        Category.insert_default_categories()
+        Location.insert_default_locations()
+        self.invalidate()
+
+
+def inject_reference_data():
+    return {'reference': reference_data}
+
+
+reference_data = ReferenceData()
+
+
+def invalidate_reference_data(*args):
+    reference_data.invalidate()
+
+
+for _model in (Location, Category):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        db.event.listen(_model, _event, invalidate_reference_data)
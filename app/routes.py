@@ -1,25 +1,35 @@
+import io
 from datetime import datetime
-from flask import render_template, redirect, flash, url_for, request, session
+from flask import Blueprint, current_app, render_template, redirect, flash, url_for, request, session, abort
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.urls import url_parse
 from sqlalchemy.orm import contains_eager
 
-from app import app, db
+from app import db, search
 from app.email import send_password_reset_email
-from app.forms import LoginForm, RegistrationForm, EditProfileForm, PostForm, ResetPasswordRequestForm, ResetPasswordForm, CompanyLoginForm, CompanyRegistrationForm, JobSearchForm, JobForm,CompanyEditForm, JobApplyForm, JobReplyForm
-from app.models import User, Post, Company, Job, Location, Category, JobApplication, JobApplicationStatus
+from app.forms import LoginForm, RegistrationForm, EditProfileForm, PostForm, ResetPasswordRequestForm, ResetPasswordForm, CompanyLoginForm, CompanyRegistrationForm, JobSearchForm, JobForm,CompanyEditForm, JobApplyForm, JobReplyForm, JobImportForm, ApplicationBulkForm
+from app.models import User, Post, Company, Job, JobApplication, JobApplicationStatus
 
-from app.decorators import user_permission_required, company_permission_required
+from app.decorators import user_permission_required, company_permission_required, statement_timeout, read_only
+from app.pagination import keyset_paginate, InvalidCursor
+from app.loaders import with_profile
+from app.presence import last_seen_buffer
+from app.security import HasherBusy, login_throttle
+from app.conditional import Freshness
+from app.job_import import detect_format, import_jobs
 
-@app.before_request
+
+bp = Blueprint('main', __name__)
+
+
+@bp.before_app_request
 def before_request():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+    if current_user.is_authenticated and current_user.__tablename__ == 'user':
+        last_seen_buffer.touch(current_user.id, stored=current_user.last_seen)
 
 
-@app.route("/", methods=['GET', 'POST'])
-@app.route("/index", methods=['GET', 'POST'])
+@bp.route("/", methods=['GET', 'POST'])
+@bp.route("/index", methods=['GET', 'POST'])
 @login_required
 # @user_permission_required
 def index():
@@ -27,48 +37,79 @@ def index():
     if form.validate_on_submit():
         post = Post(body=form.post.data, author=current_user)
         db.session.add(post)
+        db.session.flush()
+        post.fan_out()
         db.session.commit()
         flash('Your post is live!')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     page = request.args.get("page", 1, type=int)
-    posts = current_user.followed_posts().paginate(
-        page=page, per_page=app.config["POSTS_PER_PAGE"], error_out=False)
+    posts = with_profile(current_user.followed_posts(), 'timeline').paginate(
+        page=page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
     next_url = url_for(
-        'index', page=posts.next_num) if posts.next_num else None
+        'main.index', page=posts.next_num) if posts.next_num else None
     prev_url = url_for(
-        'index', page=posts.prev_num) if posts.prev_num else None
+        'main.index', page=posts.prev_num) if posts.prev_num else None
     
     return render_template("index.html.j2", title="Home", form=form,
                         posts=posts.items, next_url=next_url, prev_url=prev_url)
 
 
-@app.route('/explore')
+@bp.route('/explore')
 @login_required
+@read_only
 def explore():
 
     page = request.args.get("page", 1, type=int)
-    posts = Post.query.order_by(Post.timestamp.desc()).paginate(
-        page=page, per_page=app.config["POSTS_PER_PAGE"], error_out=False)
+    posts = with_profile(Post.query, 'timeline').order_by(Post.timestamp.desc()).paginate(
+        page=page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
     next_url = url_for(
-        'explore', page=posts.next_num) if posts.next_num else None
+        'main.explore', page=posts.next_num) if posts.next_num else None
     prev_url = url_for(
-        'explore', page=posts.prev_num) if posts.prev_num else None
-    return render_template("index.html.j2", title="Explore", posts=posts.items, next_url=next_url, prev_url=prev_url)
+        'main.explore', page=posts.prev_num) if posts.prev_num else None
+    following = None
+    if current_user.__tablename__ == 'user':
+        following = current_user.following_among({post.author for post in posts.items})
+    return render_template("index.html.j2", title="Explore", posts=posts.items, next_url=next_url, prev_url=prev_url,
+                           following=following)
     
 
-@app.route("/login", methods=['GET', 'POST'])
+def _authenticate(model, kind, form, view, template, title):
+    """Return ``(account, None)`` for good credentials, else ``(None, response)``."""
+    account_key = '{}:{}'.format(kind, form.username.data.lower())
+    retry_after = login_throttle.retry_after(request.remote_addr, account_key)
+    if retry_after:
+        flash('Too many sign-in attempts. Please try again in {} seconds.'.format(retry_after))
+        return None, (render_template(template, title=title, form=form), 429, {'Retry-After': str(retry_after)})
+    login_throttle.attempted(request.remote_addr)
+
+    account = model.query.filter_by(username=form.username.data).first()
+    try:
+        valid = account is not None and account.check_password(form.password.data)
+    except HasherBusy:
+        flash('We are busy right now. Please try again in a moment.')
+        return None, (render_template(template, title=title, form=form), 503, {'Retry-After': '1'})
+    if not valid:
+        login_throttle.failed(account_key)
+        flash('Invalid username or password!')
+        return None, redirect(url_for(view))
+
+    login_throttle.succeeded(account_key)
+    # Keeps a password hash upgraded to the current PASSWORD_HASH_METHOD.
+    db.session.commit()
+    return account, None
+
+
+@bp.route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-
-        if user is None or not user.check_password(form.password.data):
-            flash('Invalid username or password!')
-            return redirect(url_for('login'))
+        user, response = _authenticate(User, 'user', form, 'main.login', 'login.html.j2', "Sign In")
+        if user is None:
+            return response
 
         login_user(user, remember=form.remember_me.data)
         session.permanent = True
@@ -76,21 +117,21 @@ def login():
 
         next_page = request.args.get("next")
         if not next_page or url_parse(next_page).netloc != "":
-            next_page = url_for('index')
-        redirect(next_page)
+            next_page = url_for('main.index')
+        return redirect(next_page)
     return render_template('login.html.j2', title="Sign In", form=form)
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route("/register", methods=['GET', 'POST'])
+@bp.route("/register", methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(username=form.username.data, email=form.email.data)
@@ -98,51 +139,48 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash('Congraduations, you are now a registered user!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html.j2', title="Register", form=form)
 
 
-@app.route("/reset_password_request", methods=['GET', 'POST'])
+@bp.route("/reset_password_request", methods=['GET', 'POST'])
 def reset_password_request():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = ResetPasswordRequestForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         company = Company.query.filter_by(email=form.email.data).first()
-        if user:
-            send_password_reset_email(user)
-            flash('Check your email for the instructions to reset password.')
-            return redirect(url_for('login'))
-            
-        elif company:
-            send_password_reset_email(company)
-            flash('Check your email for the instructions to reset password.')
-            return redirect(url_for('login'))
+        if user or company:
+            if send_password_reset_email(user or company):
+                flash('Check your email for the instructions to reset password.')
+                return redirect(url_for('main.login'))
+            flash('We could not send the email right now. Please try again in a few minutes.')
+            return render_template('reset_password_request.html.j2', title="Reset Password", form=form), 503
         else:
             flash('User 404 Not Found')
 
     return render_template('reset_password_request.html.j2', title="Reset Password", form=form)
 
 
-@app.route("/reset_password/<token>", methods=['GET', 'POST'])
+@bp.route("/reset_password/<token>", methods=['GET', 'POST'])
 def reset_password(token):
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     user = User.verify_reset_password_token(token)
     company = Company.verify_reset_password_token(token)
 
     # if user and company:
     #     flash('Invalid token')
-    #     return redirect(url_for('index'))
+    #     return redirect(url_for('main.index'))
 
     # if not user and not company:
     #     flash('Invalid token')
-    #     return redirect(url_for('index'))
+    #     return redirect(url_for('main.index'))
 
     if user and company is None:
         flash('Invalid token')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     form = ResetPasswordForm()
     if form.validate_on_submit():
@@ -150,20 +188,20 @@ def reset_password(token):
             user.set_password(form.password.data)
             db.session.commit()
             flash('Your password has been reset.')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         
         elif company:
             company.set_password(form.password.data)
             db.session.commit()
             flash('Your password has been reset.')
-            return redirect(url_for('company_login'))
+            return redirect(url_for('main.company_login'))
         
     return render_template('reset_password.html.j2', title="Reset Password", form=form)
 
 
 
     # if user and company is None:
-    #     return redirect(url_for('index'))
+    #     return redirect(url_for('main.index'))
     
     # form = ResetPasswordForm()
     # if user and form.validate_on_submit():
@@ -181,27 +219,28 @@ def reset_password(token):
     #     db.session.commit()
     #     flash('Your password has been reset.')
     #     if user:
-    #         return redirect(url_for('login'))
+    #         return redirect(url_for('main.login'))
     #     elif company:
-    #         return redirect(url_for('company_login'))
+    #         return redirect(url_for('main.company_login'))
     # return render_template('reset_password.html.j2', title="Reset Password", form=form)
 
 
-@app.route('/user/<username>')
+@bp.route('/user/<username>')
+@read_only
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get("page", 1, type=int)
-    posts = user.followed_posts().paginate(
-        page=page, per_page=app.config["POSTS_PER_PAGE"], error_out=False)
+    posts = with_profile(user.followed_posts(), 'timeline').paginate(
+        page=page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
     next_url = url_for(
-        'index', page=posts.next_num) if posts.next_num else None
+        'main.index', page=posts.next_num) if posts.next_num else None
     prev_url = url_for(
-        'index', page=posts.prev_num) if posts.prev_num else None
+        'main.index', page=posts.prev_num) if posts.prev_num else None
     return render_template('user.html.j2', user=user, posts=posts.items,
                            next_url=next_url, prev_url=prev_url)
 
 
-@app.route('/edit_profile', methods=['GET', 'POST'])
+@bp.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     form = EditProfileForm(current_user.username)
@@ -210,56 +249,56 @@ def edit_profile():
         current_user.about_me = form.about_me.data
         db.session.commit()
         flash("Your change have been saved.")
-        return redirect(url_for('edit_profile'))
+        return redirect(url_for('main.edit_profile'))
     elif request.method == "GET":
         form.username.data = current_user.username
         form.about_me.data = current_user.about_me
     return render_template('edit_profile.html.j2', title="Edit Profile", form=form)
 
 
-@app.route('/follow/<username>')
+@bp.route('/follow/<username>')
 @login_required
 def follow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash(f"User {username} not found.")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if user == current_user:
         flash("You cannot follow yourself!")
-        return redirect(url_for('user', username=username))
+        return redirect(url_for('main.user', username=username))
     current_user.follow(user)
     db.session.commit()
     flash(f"You are following {username}!")
-    return redirect(url_for('user', username=username))
+    return redirect(url_for('main.user', username=username))
 
 
-@app.route('/unfollow/<username>')
+@bp.route('/unfollow/<username>')
 @login_required
 def unfollow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash(f"User {username} not found.")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if user == current_user:
         flash("You cannot unfollow yourself!")
-        return redirect(url_for('user', username=username))
+        return redirect(url_for('main.user', username=username))
     current_user.unfollow(user)
     db.session.commit()
     flash(f"You are not following {username}!")
-    return redirect(url_for('user', username=username))
+    return redirect(url_for('main.user', username=username))
 
 
-@app.route("/company_login", methods=['GET', 'POST'])
+@bp.route("/company_login", methods=['GET', 'POST'])
 def company_login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     form = CompanyLoginForm()
     if form.validate_on_submit():
-        company = Company.query.filter_by(username=form.username.data).first()
-        if company is None or not company.check_password(form.password.data):
-            flash('Invalid username or password!')
-            return redirect(url_for('company_login'))
+        company, response = _authenticate(Company, 'company', form, 'main.company_login',
+                                          'company_login.html.j2', "Company Sign In")
+        if company is None:
+            return response
 
         login_user(company, remember=form.remember_me.data)
         session.permanent = True
@@ -267,14 +306,14 @@ def company_login():
 
         next_page = request.args.get("next")
         if not next_page or url_parse(next_page).netloc != "":
-            next_page = url_for('index')
-        redirect(next_page)
+            next_page = url_for('main.index')
+        return redirect(next_page)
     return render_template('company_login.html.j2', title="Company Sign In", form=form)
 
-@app.route("/company_register", methods=['GET', 'POST'])
+@bp.route("/company_register", methods=['GET', 'POST'])
 def company_register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = CompanyRegistrationForm()
     if form.validate_on_submit():
         user = Company(username=form.username.data, email=form.email.data, name=form.name.data)
@@ -282,72 +321,58 @@ def company_register():
         db.session.add(user)
         db.session.commit()
         flash('Congraduations, you are now a registered Employers!')
-        return redirect(url_for('company_login'))
+        return redirect(url_for('main.company_login'))
     return render_template('company_register.html.j2', title="Register for Employer", form=form)
 
-@app.route("/job_search", methods=['GET', 'POST'])
-def job_search():
-    form = JobSearchForm()
-    jobs = []
-    search_c = request.args.get('search')
-
-    if form.validate_on_submit():
-
-        search = form.search.data
-        job_location = form.job_location.data
-        job_category = form.job_category.data
+def _choice(value, mapping=None):
+    if not value or value == 'All':
+        return None
+    if mapping is not None:
+        return mapping.get(value)
+    return int(value)
 
-        query = Job.query.join(Company).filter(
-            (Job.title.ilike(f'%{search}%')) | (Company.name.ilike(f'%{search}%'))
-        )
-
-        if job_location and job_location != 'All':
-            query = query.filter(Job.location_id == job_location)
-
-        if job_category and job_category != 'All':
-            query = query.filter(Job.category_id == job_category)
-        
-        jobs = query.all()
 
-    elif search_c is not None:
-        search_c = request.args.get('search')
-        query = Job.query.join(Company).filter(Company.name == search_c)
-
-        jobs = query.all()
-
-        # sql = f"SELECT * FROM job JOIN company ON (job.company_id = company.id) WHERE job.title ILIKE '%%{search}%%' or company.name ILIKE '%%{search}%%' "
-
-        # sql = f"SELECT * FROM job WHERE title ILIKE '%%{search}%%' "
-
-        # if job_location and job_location!='All':
-        #     sql += f" AND location_id = {job_location}"
-
-        # if job_category and job_category!='All':
-        #     sql += f" AND category_id = {job_category}" 
+@bp.route("/job_search")
+@read_only
+@statement_timeout('SEARCH_STATEMENT_TIMEOUT')
+def job_search():
+    form = JobSearchForm(formdata=request.args, meta={'csrf': False})
+    page = facets = histogram = None
+
+    if request.args and ('company' in request.args or form.validate()):
+        filters = {
+            'terms': search.normalize_terms(form.search.data),
+            'company': request.args.get('company'),
+            'location': _choice(form.job_location.data),
+            'category': _choice(form.job_category.data),
+            'available': _choice(form.available.data, {'yes': True, 'no': False}),
+            'min_salary': form.min_salary.data,
+            'max_salary': form.max_salary.data,
+        }
+        query = search.filter_jobs(with_profile(Job.query, 'search_results'), filters)
+        query, keys = search.search_jobs(query, filters['terms'], form.sort.data)
+        per_page = min(max(request.args.get('per_page', current_app.config['JOBS_PER_PAGE'], type=int), 1),
+                       current_app.config['JOBS_MAX_PER_PAGE'])
+        try:
+            page = keyset_paginate(query, keys, per_page,
+                                   after=request.args.get('after'), before=request.args.get('before'))
+        except InvalidCursor:
+            abort(400)
+        facets = search.describe_facets(search.facet_counts(filters))
+        histogram = search.salary_histogram(filters['category'])
+
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+
+    def search_url(**changes):
+        return url_for('main.job_search', **{k: v for k, v in dict(args, **changes).items() if v is not None})
+
+    next_url = search_url(after=page.next_cursor) if page and page.has_next else None
+    prev_url = search_url(before=page.prev_cursor) if page and page.has_prev else None
+    return render_template('job_search.html.j2', title="Job Search", form=form,
+                           jobs=page.items if page else [], facets=facets, histogram=histogram, search_url=search_url,
+                           next_url=next_url, prev_url=prev_url)
 
-        # if job_location == 'All' or job_category=='All':
-        #     pass
-        
-        # result = db.engine.execute(sql)
-        # jobs = [dict(row) for row in result]
-
-        # query = db.session.query(Job).filter(Job.title.like(f'%{search}%'))
-        # if job_location:
-        #     location_id = Job.query.filter_by(location_id=job_location).first().id
-        #     query = query.filter_by(location_id=location_id)
-        # if job_category:
-        #     category_id = Job.query.filter_by(category_id=job_category).first().id
-        #     query = query.filter_by(category_id=category_id)
-        # if job_location and job_category:
-        #     query = query.filter(
-        #         Job.location_id == location_id,
-        #         Job.category_id == category_id
-        #     )
-        # jobs = query.all()
-
-    return render_template('job_search.html.j2', title="Job Search", form=form, jobs=jobs)
-
-@app.route("/job_publish", methods=['GET', 'POST'])
+@bp.route("/job_publish", methods=['GET', 'POST'])
 @login_required
 def job_publish():
     form = JobForm()
@@ -360,20 +385,40 @@ def job_publish():
         form.title.data = ''
         form.description.data = ''
         form.requirement.data = ''
-        form.salary.data = ''
+        form.salary.data = None
         form.location.data = '' 
         form.category.data = ''
         
         db.session.add(job)
+        db.session.flush()
+        search.index_job(job)
         db.session.commit()
 
         flash("Job Posted")
     return render_template('job_publish.html.j2', title="Job Publish", form=form)
 
-@app.route("/jobs")
+@bp.route("/jobs/import", methods=['GET', 'POST'])
+@login_required
+@company_permission_required
+def job_import():
+    form = JobImportForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        try:
+            report = import_jobs(current_user, stream, detect_format(upload.filename), dry_run=form.dry_run.data)
+        except UnicodeDecodeError:
+            flash("The file is not UTF-8 encoded.")
+        else:
+            verb = 'would be imported' if form.dry_run.data else 'imported'
+            flash("{} jobs {}, {} rows rejected.".format(report.imported, verb, report.rejected))
+    return render_template('job_import.html.j2', title="Import Jobs", form=form, report=report)
+
+@bp.route("/jobs")
 def jobs():
     #grab all the job form database
-    jobs = Job.query.filter_by(company_id=current_user.id).order_by(Job.created_at)
+    jobs = with_profile(Job.query, 'company_jobs').filter_by(company_id=current_user.id).order_by(Job.created_at)
 
     return render_template("jobs.html.j2", jobs=jobs)
 
@@ -381,24 +426,28 @@ def jobs():
 
 
 
-@app.route('/company/<username>')
+@bp.route('/company/<username>')
+@read_only
 def company(username):
     user = Company.query.filter_by(username=username).first_or_404()
-    
-    return render_template('company.html.j2', user=user)
+    freshness = Freshness(user.updated_at)
+    return freshness.respond(lambda: render_template('company.html.j2', user=user))
 
-@app.route('/edit_company', methods=['GET', 'POST'])
+@bp.route('/edit_company', methods=['GET', 'POST'])
 @login_required
 def edit_company():
     form = CompanyEditForm(current_user.username)
     if form.validate_on_submit():
+        renamed = current_user.name != form.name.data
         current_user.username = form.username.data
         current_user.name = form.name.data
         current_user.email = form.email.data
+        if renamed:
+            search.reindex_company(current_user)
 
         db.session.commit()
         flash("Your change have been saved.")
-        return redirect(url_for('edit_company'))
+        return redirect(url_for('main.edit_company'))
     elif request.method == "GET":
         form.username.data = current_user.username
         form.name.data = current_user.name
@@ -407,60 +456,64 @@ def edit_company():
 
 
 
-@app.route('/jobs/<int:id>')
+@bp.route('/jobs/<int:id>')
+@read_only
 def job(id):
-    job = Job.query.get_or_404(id)
-    return render_template('job.html.j2', job=job)
+    job = with_profile(Job.query, 'job_detail').filter_by(id=id).first_or_404()
+    freshness = Freshness(job.updated_at, job.publisher.updated_at if job.publisher else None)
+    return freshness.respond(lambda: render_template('job.html.j2', job=job))
 
 
 
-@app.route('/jobs/edit/<int:id>', methods=['GET', 'POST'])
+@bp.route('/jobs/edit/<int:id>', methods=['GET', 'POST'])
 def edit_job(id):
-    job = Job.query.get_or_404(id)
+    job = with_profile(Job.query, 'job_form').filter_by(id=id).first_or_404()
     form = JobForm()
     if form.validate_on_submit():
         job.title = form.title.data
         job.description = form.description.data
         job.requirement = form.requirement.data
         job.salary = form.salary.data
-        job.location = form.location.data
-        job.category = form.category.data
+        job.location_id = form.location.data
+        job.category_id = form.category.data
         # Update Database
         db.session.add(job)
+        search.index_job(job)
         db.session.commit()
         flash("Job Has Been Updated!")
-        return redirect(url_for('job', id=job.id))
+        return redirect(url_for('main.job', id=job.id))
     
     form.title.data = job.title
     form.description.data = job.description
     form.requirement.data = job.requirement
     form.salary.data = job.salary
-    form.location.data = job.location
-    form.category.data = job.category
+    form.location.data = str(job.location_id)
+    form.category.data = str(job.category_id)
     return render_template('edit_job.html.j2', form=form)
 
-@app.route('/jobs/delete/<int:id>')
+@bp.route('/jobs/delete/<int:id>')
 def delete_job(id):
     job_to_delete = Job.query.get_or_404(id)
 
     try:
+        search.remove_job(job_to_delete)
         db.session.delete(job_to_delete)
         db.session.commit()
 
         flash("Job Was Deleted!")
 
-        jobs = Job.query.filter_by(company_id=current_user.id).order_by(Job.created_at)
+        jobs = with_profile(Job.query, 'company_jobs').filter_by(company_id=current_user.id).order_by(Job.created_at)
         return render_template("jobs.html.j2", jobs=jobs)
     
     except:
         flash("Oops! There was a problem deleting job, try again...")
 
-        jobs = Job.query.filter_by(company_id=current_user.id).order_by(Job.created_at)
+        jobs = with_profile(Job.query, 'company_jobs').filter_by(company_id=current_user.id).order_by(Job.created_at)
         return render_template("jobs.html.j2", jobs=jobs)
 
 
 
-@app.route("/jobs//job_apply/<int:id>", methods=['GET', 'POST'])
+@bp.route("/jobs//job_apply/<int:id>", methods=['GET', 'POST'])
 @login_required
 def apply_job(id):
     form = JobApplyForm()
@@ -469,7 +522,7 @@ def apply_job(id):
     duplication_check = JobApplication.query.filter_by(job_id=id, user_id=current_user.id).first()
     if duplication_check:
         flash('You can not apply twice!')
-        return redirect(url_for('job_search'))
+        return redirect(url_for('main.job_search'))
     
     if form.validate_on_submit():
         user = current_user.id
@@ -495,34 +548,101 @@ def apply_job(id):
         db.session.commit()
 
         flash("Job Application Submitted")
-        return redirect(url_for('job_search'))
+        return redirect(url_for('main.job_search'))
     return render_template('job_apply.html.j2', title="Job Apply", form=form)
 
 
-@app.route("/applications")
+def _company_jobs():
+    return db.session.query(Job.id, Job.title).filter_by(company_id=current_user.id).order_by(Job.title).all()
+
+
+def _render_applications(bulk_form=None, selected=()):
+    if session.get('type') == 'company':
+        return _company_inbox(bulk_form, selected)
+    applications = with_profile(JobApplication.query, 'applications_inbox').filter_by(user_id=current_user.id).order_by(JobApplication.created_at).all()
+    return render_template("applications.html.j2", applications=applications)
+
+
+def _company_inbox(bulk_form=None, selected=()):
+    job_id = request.args.get('job', type=int)
+    status = request.args.get('status') or None
+    query = with_profile(JobApplication.query, 'applications_inbox').filter_by(company_id=current_user.id)
+    if job_id is not None:
+        query = query.filter_by(job_id=job_id)
+    if status is not None:
+        query = query.filter_by(status=status)
+    keys = [(JobApplication.created_at, False), (JobApplication.id, False)]
+    try:
+        page = keyset_paginate(query, keys, current_app.config['APPLICATIONS_PER_PAGE'],
+                               after=request.args.get('after'), before=request.args.get('before'))
+    except InvalidCursor:
+        abort(400)
+
+    jobs = _company_jobs()
+    if bulk_form is None:
+        bulk_form = ApplicationBulkForm(jobs=jobs, job=str(job_id) if job_id is not None else 'All',
+                                        status=status or 'All')
+
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+    next_url = url_for('main.applications', after=page.next_cursor, **args) if page.has_next else None
+    prev_url = url_for('main.applications', before=page.prev_cursor, **args) if page.has_prev else None
+    return render_template("applications.html.j2", applications=page.items, bulk_form=bulk_form, selected=selected,
+                           jobs=jobs, counts=JobApplication.inbox_counts(current_user.id),
+                           statuses=[s.value for s in JobApplicationStatus], job_id=job_id, status=status,
+                           next_url=next_url, prev_url=prev_url)
+
+
+def _bulk_form():
+    return ApplicationBulkForm(jobs=_company_jobs())
+
+
+@bp.route("/applications")
 @login_required
 def applications():
+    return _render_applications()
 
-    type = session.get('type')
-    if type == 'user':
-        applications = JobApplication.query.filter_by(user_id=current_user.id).order_by(JobApplication.created_at).all()
-    elif type == 'company':
-        applications = JobApplication.query.filter_by(company_id=current_user.id).order_by(JobApplication.created_at).all()
 
-    return render_template("applications.html.j2", applications=applications)
+@bp.route("/applications/bulk", methods=['POST'])
+@login_required
+@company_permission_required
+def application_bulk():
+    form = _bulk_form()
+    selected = request.form.getlist('application_ids', type=int)
+    if form.validate_on_submit():
+        query = JobApplication.query.filter_by(company_id=current_user.id)
+        if form.scope.data == 'selected':
+            if not selected:
+                flash("Select at least one application.")
+                return _render_applications(form, selected)
+            query = query.filter(JobApplication.id.in_(selected))
+        else:
+            if form.job.data != 'All':
+                query = query.filter_by(job_id=int(form.job.data))
+            if form.status.data != 'All':
+                query = query.filter_by(status=form.status.data)
+
+        count = JobApplication.bulk_transition(query, form.new_status.data, form.reply.data,
+                                               dry_run=form.preview.data)
+        if form.preview.data:
+            flash("{} applications would be moved to {}.".format(count, form.new_status.data))
+            return _render_applications(form, selected)
+        db.session.commit()
+        flash("{} applications moved to {}.".format(count, form.new_status.data))
+        return redirect(url_for('main.applications', **{k: v for k, v in request.args.items() if k in ('job', 'status')}))
+    return _render_applications(form, selected)
 
 
-@app.route('/applications/<int:id>')
+@bp.route('/applications/<int:id>')
 @login_required
 def application(id):
-    application = JobApplication.query.get_or_404(id)
+    application = with_profile(JobApplication.query, 'application_detail').filter_by(id=id).first_or_404()
     return render_template('application.html.j2', application=application)
 
 
-@app.route('/applications/edit/<int:id>', methods=['GET', 'POST'])
+@bp.route('/applications/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 def application_edit(id):
-    application = JobApplication.query.get_or_404(id)
+    application = with_profile(JobApplication.query, 'application_detail').filter_by(id=id).first_or_404()
     form = JobApplyForm()
     if form.validate_on_submit():
         application.name = form.name.data
@@ -534,7 +654,7 @@ def application_edit(id):
         db.session.add(application)
         db.session.commit()
         flash("Application Has Been Updated!")
-        return redirect(url_for('application', id=application.id))
+        return redirect(url_for('main.application', id=application.id))
     
     form.name.data = application.name
     form.contact_number.data = application.contact_number
@@ -544,10 +664,10 @@ def application_edit(id):
     
     return render_template('application_edit.html.j2', form=form)
 
-@app.route('/applications/reply/<int:id>', methods=['GET', 'POST'])
+@bp.route('/applications/reply/<int:id>', methods=['GET', 'POST'])
 @login_required
 def application_reply(id):
-    application = JobApplication.query.get_or_404(id)
+    application = with_profile(JobApplication.query, 'application_detail').filter_by(id=id).first_or_404()
     form = JobReplyForm()
     if form.validate_on_submit():
         application.reply = form.reply.data
@@ -557,14 +677,14 @@ def application_reply(id):
         db.session.commit()
 
         flash("Application Has Been Updated!")
-        return redirect(url_for('application', id=application.id))
+        return redirect(url_for('main.application', id=application.id))
 
     form.reply.data = application.reply
     form.status.data = application.status
 
     return render_template('application_edit.html.j2', form=form)
 
-@app.route('/applications/delete/<int:id>')
+@bp.route('/applications/delete/<int:id>')
 def application_delete(id):
     application_to_delete = JobApplication.query.get_or_404(id)
 
@@ -574,11 +694,11 @@ def application_delete(id):
 
         flash("Application Was Deleted!")
 
-        applications = JobApplication.query.filter_by(user_id=current_user.id).order_by(JobApplication.created_at)
+        applications = with_profile(JobApplication.query, 'applications_inbox').filter_by(user_id=current_user.id).order_by(JobApplication.created_at)
         return render_template("applications.html.j2", applications=applications)
     
     except:
         flash("Oops! There was a problem deleting application, try again...")
 
-        applications = JobApplication.query.filter_by(user_id=current_user.id).order_by(JobApplication.created_at)
+        applications = with_profile(JobApplication.query, 'applications_inbox').filter_by(user_id=current_user.id).order_by(JobApplication.created_at)
         return render_template("applications.html.j2", applications=applications)
\ No newline at end of file
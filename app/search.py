@@ -0,0 +1,297 @@
+import re
+from collections import Counter
+
+from sqlalchemy import Float, case, cast, column, func, insert, literal_column, null, table, text
+from sqlalchemy.orm import undefer_group
+
+from app import db
+from app.cache import TTLCache
+from app.models import Company, Job, JobSearchDocument, search_vector
+from app.reference import reference_data
+
+
+SORT_ORDERS = [
+    ('relevance', 'Best match'),
+    ('newest', 'Newest'),
+    ('salary_high', 'Highest salary'),
+    ('salary_low', 'Lowest salary'),
+]
+
+# Upper bounds (exclusive) of the salary facet buckets; the last bucket is open.
+SALARY_BUCKETS = [10000, 20000, 30000, 50000]
+
+FACETS = [
+    ('location', 'job_location', 'Location'),
+    ('category', 'job_category', 'Category'),
+    ('available', 'available', 'Availability'),
+    ('salary', 'salary', 'Salary (HKD)'),
+]
+
+facet_cache = TTLCache()
+
+job_fts = table('job_fts', column('rowid'), column('heading'), column('body'))
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def document_parts(title, publisher, description, requirement):
+    heading = ' '.join(part for part in (title, publisher) if part)
+    body = '\n'.join(part for part in (description, requirement) if part)
+    return heading, body
+
+
+def _document_parts(job):
+    publisher = job.publisher.name if job.publisher else ''
+    return document_parts(job.title, publisher, job.description, job.requirement)
+
+
+def index_job(job):
+    heading, body = _document_parts(job)
+    document = db.session.get(JobSearchDocument, job.id)
+    if document is None:
+        db.session.add(JobSearchDocument(job_id=job.id, heading=heading, body=body))
+    else:
+        document.heading = heading
+        document.body = body
+
+    if _dialect() == 'sqlite':
+        db.session.execute(text('DELETE FROM job_fts WHERE rowid = :id'), {'id': job.id})
+        db.session.execute(text('INSERT INTO job_fts (rowid, heading, body) VALUES (:id, :heading, :body)'),
+                           {'id': job.id, 'heading': heading, 'body': body})
+
+
+def index_documents(documents):
+    """Add search documents for new jobs in one executemany per table.
+
+    ``documents`` is a list of ``{'job_id', 'heading', 'body'}`` dicts.
+    """
+    if not documents:
+        return
+    db.session.execute(insert(JobSearchDocument), documents)
+    if _dialect() == 'sqlite':
+        db.session.execute(text('INSERT INTO job_fts (rowid, heading, body) VALUES (:job_id, :heading, :body)'),
+                           documents)
+
+
+def remove_job(job):
+    JobSearchDocument.query.filter_by(job_id=job.id).delete(synchronize_session=False)
+    if _dialect() == 'sqlite':
+        db.session.execute(text('DELETE FROM job_fts WHERE rowid = :id'), {'id': job.id})
+
+
+def reindex_company(company):
+    for job in company.publishes.options(undefer_group('body')):
+        index_job(job)
+
+
+def reindex_all():
+    count = 0
+    for job in Job.query.options(undefer_group('body')).order_by(Job.id):
+        index_job(job)
+        count += 1
+    return count
+
+
+def _fts5_query(terms):
+    # Quote every token so user input can never be parsed as FTS5 syntax.
+    words = re.findall(r'\w+', terms)
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def match_jobs(query, terms):
+    """Restrict ``query`` to jobs matching ``terms``.
+
+    Returns ``(query, rank, descending)`` where ``rank`` orders the matches
+    best first in the given direction, or is ``None`` when nothing ranks.
+    """
+    terms = (terms or '').strip()
+    if not terms:
+        return query, None, True
+
+    if _dialect() == 'postgresql':
+        vector = search_vector(JobSearchDocument.heading, JobSearchDocument.body)
+        tsquery = func.websearch_to_tsquery(literal_column("'english'::regconfig"), terms)
+        # ts_rank_cd() is a float4, widen it so cursors round-trip exactly.
+        rank = cast(func.ts_rank_cd(vector, tsquery), Float)
+        query = query.join(JobSearchDocument, JobSearchDocument.job_id == Job.id) \
+            .filter(vector.op('@@')(tsquery))
+        return query, rank, True
+
+    if _dialect() == 'sqlite':
+        match = _fts5_query(terms)
+        if not match:
+            return query.filter(db.false()), None, True
+        # bm25() scores are negative, the best match sorts first ascending.
+        rank = func.bm25(literal_column('job_fts'), 10.0, 1.0)
+        query = query.join(job_fts, job_fts.c.rowid == Job.id) \
+            .filter(literal_column('job_fts').op('MATCH')(match))
+        return query, rank, False
+
+    pattern = '%{}%'.format(terms)
+    query = query.join(JobSearchDocument, JobSearchDocument.job_id == Job.id) \
+        .filter(JobSearchDocument.heading.ilike(pattern) | JobSearchDocument.body.ilike(pattern))
+    return query, None, True
+
+
+def search_jobs(query, terms, sort=None):
+    """Restrict ``query`` to jobs matching ``terms``, ordered by ``sort``.
+
+    Returns ``(query, keys)`` with the sort keys in the form
+    :func:`app.pagination.keyset_paginate` expects.
+    """
+    query, rank, rank_desc = match_jobs(query, terms)
+    if sort not in dict(SORT_ORDERS) or (sort == 'relevance' and rank is None):
+        sort = 'relevance' if rank is not None else 'newest'
+
+    if sort == 'relevance':
+        keys = [(rank, rank_desc), (Job.id, rank_desc)]
+    elif sort == 'salary_high':
+        query = query.filter(Job.salary.isnot(None))
+        keys = [(Job.salary, True), (Job.id, True)]
+    elif sort == 'salary_low':
+        query = query.filter(Job.salary.isnot(None))
+        keys = [(Job.salary, False), (Job.id, False)]
+    else:
+        keys = [(Job.updated_at, True), (Job.id, True)]
+    return query, keys
+
+
+def normalize_terms(terms):
+    return ' '.join((terms or '').lower().split())
+
+
+def filter_jobs(query, filters):
+    if filters.get('company') is not None:
+        query = query.join(Company, Company.id == Job.company_id).filter(Company.name == filters['company'])
+    if filters.get('location') is not None:
+        query = query.filter(Job.location_id == filters['location'])
+    if filters.get('category') is not None:
+        query = query.filter(Job.category_id == filters['category'])
+    if filters.get('available') is not None:
+        query = query.filter(Job.available.is_(filters['available']))
+    if filters.get('min_salary') is not None:
+        query = query.filter(Job.salary >= filters['min_salary'])
+    if filters.get('max_salary') is not None:
+        query = query.filter(Job.salary <= filters['max_salary'])
+    return query
+
+
+def salary_bucket():
+    whens = [(Job.salary.is_(None), null())]
+    whens += [(Job.salary < literal_column(str(upper)), i) for i, upper in enumerate(SALARY_BUCKETS)]
+    return case(*whens, else_=len(SALARY_BUCKETS))
+
+
+def salary_bucket_range(bucket):
+    lower = SALARY_BUCKETS[bucket - 1] if bucket > 0 else 0
+    upper = SALARY_BUCKETS[bucket] - 1 if bucket < len(SALARY_BUCKETS) else None
+    return lower, upper
+
+
+def salary_bucket_label(bucket):
+    if bucket is None:
+        return 'Not disclosed'
+    if bucket == 0:
+        return 'Below {:,}'.format(SALARY_BUCKETS[0])
+    if bucket == len(SALARY_BUCKETS):
+        return '{:,} or more'.format(SALARY_BUCKETS[-1])
+    return '{:,} - {:,}'.format(SALARY_BUCKETS[bucket - 1], SALARY_BUCKETS[bucket])
+
+
+def _facet_rows(filters):
+    scope_filters = {name: filters.get(name) for name in ('company', 'min_salary', 'max_salary')}
+    key = ('facets', filters.get('terms', '')) + tuple(sorted(scope_filters.items()))
+    rows = facet_cache.get(key)
+    if rows is not None:
+        return rows
+
+    scope = filter_jobs(Job.query, scope_filters)
+    scope, _, _ = match_jobs(scope, filters.get('terms'))
+    bucket = salary_bucket().label('salary_bucket')
+    grouped = scope.order_by(None).with_entities(
+        Job.location_id, Job.category_id, Job.available, bucket, func.count(Job.id)
+    ).group_by(Job.location_id, Job.category_id, Job.available, literal_column('salary_bucket'))
+    rows = tuple(tuple(row) for row in grouped)
+    facet_cache.set(key, rows)
+    return rows
+
+
+def facet_counts(filters):
+    """Count matching jobs per location, category, availability and salary bucket.
+
+    All counts come from one grouped query over the text-matched jobs (and
+    the salary range, which the buckets cannot express exactly). Each
+    dimension is then counted with the selections on the other dimensions
+    applied, so every count is the number of results the option would give.
+    """
+    names = [name for name, _, _ in FACETS]
+    selected = {name: filters.get(name) for name in names}
+    counts = {name: Counter() for name in names}
+    for row in _facet_rows(filters):
+        values = dict(zip(names, row[:-1]))
+        for name in names:
+            if all(selected[other] is None or selected[other] == values[other]
+                   for other in names if other != name):
+                counts[name][values[name]] += row[-1]
+    return counts
+
+
+def describe_facets(counts):
+    labels = {
+        'location': reference_data.location,
+        'category': reference_data.category,
+        'available': lambda value: 'Still available' if value else 'Closed',
+        'salary': salary_bucket_label,
+    }
+    facets = []
+    for name, param, title in FACETS:
+        entries = []
+        for value, count in counts[name].items():
+            if value is None:
+                continue
+            if name == 'available':
+                params = {param: 'yes' if value else 'no'}
+            elif name == 'salary':
+                params = dict(zip(('min_salary', 'max_salary'), salary_bucket_range(value)))
+            else:
+                params = {param: value}
+            entries.append((params, labels[name](value), count))
+        entries.sort(key=lambda entry: (-entry[2], entry[1]))
+        facets.append({'name': name, 'param': param, 'title': title, 'entries': entries})
+    return facets
+
+
+def salary_histogram(category_id=None):
+    """Posted salaries per bucket for one category, or all of them.
+
+    Every category is counted by one grouped query that the
+    (category_id, salary) index answers on its own; the result is kept in
+    the facet cache until the next job write.
+    """
+    histograms = facet_cache.get('salary_histogram')
+    if histograms is None:
+        bucket = salary_bucket().label('salary_bucket')
+        rows = db.session.query(Job.category_id, bucket, func.count()) \
+            .filter(Job.salary.isnot(None)) \
+            .group_by(Job.category_id, literal_column('salary_bucket'))
+        histograms = {}
+        for category, value, count in rows:
+            for key in (category, None):
+                histogram = histograms.setdefault(key, [0] * (len(SALARY_BUCKETS) + 1))
+                histogram[value] += count
+        facet_cache.set('salary_histogram', histograms)
+
+    counts = histograms.get(category_id) or [0] * (len(SALARY_BUCKETS) + 1)
+    peak = max(counts) or 1
+    return [(salary_bucket_label(i), dict(zip(('min_salary', 'max_salary'), salary_bucket_range(i))),
+             count, 100 * count // peak) for i, count in enumerate(counts)]
+
+
+def invalidate_facets(*args):
+    facet_cache.clear()
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Job, _event, invalidate_facets)
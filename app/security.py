@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when every password hashing slot stays taken for too long."""
+
+
+class PasswordHasher(object):
+    """Runs password hashing on a small fixed pool of threads.
+
+    At most ``PASSWORD_HASH_WORKERS`` hashes are computed at once and at
+    most ``PASSWORD_HASH_QUEUE`` more may wait; a caller that cannot get a
+    slot within ``PASSWORD_HASH_WAIT`` seconds gets :class:`HasherBusy`
+    instead of queueing behind a burst of login attempts.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.wait = app.config['PASSWORD_HASH_WAIT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+
+    def _pool(self):
+        # Worker threads do not survive a fork, so each process makes its own.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            return self._pool().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return not pwhash.startswith(self.method + '$')
+
+    def check(self, account, password):
+        """Verify ``password`` for ``account``, upgrading a stale hash on success.
+
+        The caller commits the session to keep an upgraded hash.
+        """
+        if not self.verify(account.password_hash, password):
+            return False
+        if self.needs_rehash(account.password_hash):
+            account.password_hash = self.hash(password)
+        return True
+
+
+class SlidingWindow(object):
+    """Counts events per key over the last ``window`` seconds, in memory.
+
+    The counts live in this process only and are not shared between workers.
+    """
+
+    def __init__(self, limit, window, maxsize=100000, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self.clock = clock
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def hit(self, key):
+        now = self.clock()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.maxsize:
+                self._events.popitem(last=False)
+
+    def retry_after(self, key):
+        """Seconds until ``key`` is under its limit again, or 0."""
+        now = self.clock()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit:
+                return 0
+            return max(int(events[-self.limit] + self.window - now) + 1, 1)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class LoginThrottle(object):
+    """Per-IP limits on sign-in attempts and per-account limits on failures.
+
+    Limits are enforced per process: with N workers a client can make up to
+    N times the configured number of attempts before every worker blocks it.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.by_ip = SlidingWindow(app.config['LOGIN_IP_LIMIT'], app.config['LOGIN_IP_WINDOW'])
+        self.by_account = SlidingWindow(app.config['LOGIN_ACCOUNT_LIMIT'], app.config['LOGIN_ACCOUNT_WINDOW'])
+
+    def retry_after(self, ip, account):
+        return max(self.by_ip.retry_after(ip), self.by_account.retry_after(account))
+
+    def attempted(self, ip):
+        self.by_ip.hit(ip)
+
+    def failed(self, account):
+        self.by_account.hit(account)
+
+    def succeeded(self, account):
+        self.by_account.reset(account)
+
+
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
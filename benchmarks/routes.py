@@ -0,0 +1,381 @@
+"""Route latency benchmark driven through the WSGI app.
+
+    python benchmarks/routes.py run --concurrency 8 --requests 200 --output new.json
+    python benchmarks/routes.py compare old.json new.json --threshold 10
+
+``run`` seeds a fresh database (a temporary SQLite file unless
+``--database-uri`` is given; every table in it is dropped), warms each
+route up and then sends ``--requests`` requests from ``--concurrency``
+threads, each with its own signed-in test client. Results are JSON.
+"""
+import abc
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import seed  # noqa: E402
+
+
+class Scenario(abc.ABC):
+    """The requests one route is benchmarked with.
+
+    ``identity(thread)`` names the account a thread signs in as, or None.
+    ``requests(thread, count)`` returns ``(method, path, form)`` tuples.
+    """
+
+    fresh_client = False
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def identity(self, thread):
+        users = seed.applicants(self.sizes)
+        return 'user', users[thread % len(users)]
+
+    @abc.abstractmethod
+    def requests(self, thread, count):
+        """``count`` requests for ``thread`` to send."""
+
+
+class Index(Scenario):
+    def requests(self, thread, count):
+        return [('GET', '/index?page={}'.format(1 + i % 3), None) for i in range(count)]
+
+
+class Explore(Scenario):
+    def requests(self, thread, count):
+        return [('GET', '/explore?page={}'.format(1 + i % 5), None) for i in range(count)]
+
+
+class JobSearch(Scenario):
+    QUERIES = [
+        {'search': 'python developer'},
+        {'search': 'engineer', 'job_location': '2'},
+        {'search': '', 'job_category': '3', 'min_salary': '20000'},
+        {'search': 'senior', 'sort': 'newest'},
+        {'search': 'nurse', 'available': 'yes', 'sort': 'salary_high'},
+        {'search': 'accountant', 'max_salary': '30000'},
+    ]
+
+    def requests(self, thread, count):
+        return [('GET', '/job_search?' + urlencode(self.QUERIES[(thread + i) % len(self.QUERIES)]), None)
+                for i in range(count)]
+
+
+class JobDetail(Scenario):
+    def requests(self, thread, count):
+        jobs = self.sizes['jobs']
+        return [('GET', '/jobs/{}'.format(1 + (thread * 7919 + i * 104729) % jobs), None)
+                for i in range(count)]
+
+
+class ApplyJob(Scenario):
+    """Each thread submits as its own fresh user, one new job per request."""
+
+    def __init__(self, sizes):
+        super().__init__(sizes)
+        self._next = {}
+
+    def identity(self, thread):
+        return 'user', seed.newcomers(self.sizes)[thread]
+
+    def requests(self, thread, count):
+        start = self._next.get(thread, 0)
+        self._next[thread] = start + count
+        form = {'name': 'Bench User', 'contact_number': '91234567', 'contact_email': 'bench@example.com',
+                'resume': 'Ten years of benchmark experience. ' * 20, 'message': 'Hello.'}
+        return [('POST', '/jobs/job_apply/{}'.format(1 + (start + i) % self.sizes['jobs']), form)
+                for i in range(count)]
+
+
+class Applications(Scenario):
+    def requests(self, thread, count):
+        return [('GET', '/applications', None) for _ in range(count)]
+
+
+class CompanyApplications(Scenario):
+    def identity(self, thread):
+        return 'company', 1 + thread % self.sizes['companies']
+
+    def requests(self, thread, count):
+        return [('GET', '/applications', None) for _ in range(count)]
+
+
+class Login(Scenario):
+    fresh_client = True
+
+    def identity(self, thread):
+        return None
+
+    def requests(self, thread, count):
+        users = seed.applicants(self.sizes)
+        return [('POST', '/login', {'username': 'user{}'.format(users[(thread + i) % len(users)]),
+                                    'password': seed.PASSWORD})
+                for i in range(count)]
+
+
+SCENARIOS = {
+    'index': Index,
+    'explore': Explore,
+    'job_search': JobSearch,
+    'job': JobDetail,
+    'apply_job': ApplyJob,
+    'applications': Applications,
+    'company_applications': CompanyApplications,
+    'login': Login,
+}
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100.0 * len(ordered)) - 1)]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    statuses = Counter(str(status) for _, status, _ in samples)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 400),
+        'statuses': dict(sorted(statuses.items())),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def _client(app, identity):
+    client = app.test_client()
+    if identity is not None:
+        kind, account_id = identity
+        with client.session_transaction() as session:
+            session['_user_id'] = '{}.{}'.format(kind, account_id)
+            session['_fresh'] = True
+            session['type'] = kind
+    return client
+
+
+def _drive(app, scenario, thread, count, samples):
+    client = _client(app, scenario.identity(thread))
+    for method, path, form in scenario.requests(thread, count):
+        if scenario.fresh_client:
+            client = _client(app, scenario.identity(thread))
+        started = time.perf_counter()
+        try:
+            response = client.open(path, method=method, data=form)
+            status = response.status_code
+            queries = response.headers.get('X-DB-Query-Count')
+            response.close()
+        except Exception as e:
+            status, queries = type(e).__name__, None
+        samples.append((time.perf_counter() - started, status, int(queries) if queries else None))
+
+
+def drive(app, scenario, concurrency, total):
+    """Split ``total`` requests over ``concurrency`` threads; returns (samples, seconds)."""
+    samples = []
+    shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=_drive, args=(app, scenario, i, share, samples))
+               for i, share in enumerate(shares) if share]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def _commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    check=True, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def make_app(uri):
+    from app import create_app
+    from app.config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_REPLICA_URIS = []
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        MAIL_SUPPRESS_SEND = True
+        # X-DB-Query-Count on every response, without the log file.
+        SQL_INSTRUMENTATION = True
+        SQL_INSTRUMENTATION_LOG = ''
+        # The login route is measured, not throttled.
+        LOGIN_IP_LIMIT = LOGIN_ACCOUNT_LIMIT = sys.maxsize
+
+    return create_app(BenchmarkConfig)
+
+
+def run(args):
+    routes = args.routes or list(SCENARIOS)
+    unknown = set(routes) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit('unknown route: {}'.format(', '.join(sorted(unknown))))
+    sizes = dict(seed.DEFAULTS, users=args.users, companies=args.companies, jobs=args.jobs)
+    if args.concurrency > len(seed.newcomers(sizes)):
+        raise SystemExit('--concurrency must not exceed half of --users')
+    if 'apply_job' in routes and args.requests + args.warmup > args.concurrency * sizes['jobs']:
+        raise SystemExit('apply_job needs more --jobs for that many requests')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database_uri or 'sqlite:///' + os.path.join(tmp, 'benchmark.db')
+        app = make_app(uri)
+        with app.app_context():
+            from app import db
+            from app.presence import last_seen_buffer
+            started = time.perf_counter()
+            seed.seed(sizes, random_seed=args.seed)
+            seeded = time.perf_counter() - started
+            dialect = db.engine.dialect.name
+
+        results = {}
+        for name in routes:
+            scenario = SCENARIOS[name](sizes)
+            if args.warmup:
+                drive(app, scenario, args.concurrency, args.warmup)
+            samples, elapsed = drive(app, scenario, args.concurrency, args.requests)
+            results[name] = summarize(samples, elapsed)
+            print('{:<22} {:>8.1f} req/s  p50 {:>8.2f} ms  p95 {:>8.2f} ms  p99 {:>8.2f} ms  {} queries'.format(
+                name, results[name]['throughput_rps'], results[name]['latency_ms']['p50'],
+                results[name]['latency_ms']['p95'], results[name]['latency_ms']['p99'],
+                results[name]['queries']['mean']), file=sys.stderr)
+
+        with app.app_context():
+            # Before the temporary database goes away.
+            last_seen_buffer.flush()
+            db.engine.dispose()
+
+    report = {
+        'benchmark': 'routes',
+        'commit': _commit(),
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'python': sys.version.split()[0],
+        'database': dialect,
+        'seed': dict(sizes, random_seed=args.seed, seconds=round(seeded, 2)),
+        'concurrency': args.concurrency,
+        'warmup': args.warmup,
+        'routes': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def _change(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return (new - old) * 100.0 / old
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print('{} -> {}'.format(baseline.get('commit'), candidate.get('commit')))
+    print('{:<22} {:>20} {:>20} {:>20} {:>14}'.format('route', 'p50 ms', 'p95 ms', 'req/s', 'queries'))
+    regressions = []
+    for name, new in candidate['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for old_value, new_value in [(old['latency_ms']['p50'], new['latency_ms']['p50']),
+                                     (old['latency_ms']['p95'], new['latency_ms']['p95']),
+                                     (old['throughput_rps'], new['throughput_rps'])]:
+            change = _change(old_value, new_value)
+            cells.append('{:.2f} ({:+.0f}%)'.format(new_value, change) if change is not None else str(new_value))
+        cells.append('{} -> {}'.format(old['queries']['mean'], new['queries']['mean']))
+        print('{:<22} {:>20} {:>20} {:>20} {:>14}'.format(name, *cells))
+
+        if args.threshold is not None:
+            slower = _change(old['latency_ms']['p95'], new['latency_ms']['p95'])
+            fewer = _change(old['throughput_rps'], new['throughput_rps'])
+            if slower is not None and slower > args.threshold:
+                regressions.append('{}: p95 {:+.0f}%'.format(name, slower))
+            if fewer is not None and -fewer > args.threshold:
+                regressions.append('{}: throughput {:+.0f}%'.format(name, fewer))
+            if (new['queries']['mean'] or 0) > (old['queries']['mean'] or 0):
+                regressions.append('{}: {} -> {} queries'.format(name, old['queries']['mean'], new['queries']['mean']))
+            if new['errors'] > old['errors']:
+                regressions.append('{}: {} -> {} errors'.format(name, old['errors'], new['errors']))
+
+    if regressions:
+        print('\nRegressions beyond {}%:\n  {}'.format(args.threshold, '\n  '.join(regressions)))
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Seed a database and benchmark the routes.')
+    run_parser.add_argument('routes', nargs='*', metavar='ROUTE',
+                            help='Any of {} (default: all).'.format(', '.join(SCENARIOS)))
+    run_parser.add_argument('--database-uri', help='Database to seed and use; all its tables are dropped.')
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--requests', type=int, default=200, help='Measured requests per route.')
+    run_parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route first.')
+    run_parser.add_argument('--users', type=int, default=seed.DEFAULTS['users'])
+    run_parser.add_argument('--companies', type=int, default=seed.DEFAULTS['companies'])
+    run_parser.add_argument('--jobs', type=int, default=seed.DEFAULTS['jobs'])
+    run_parser.add_argument('--seed', type=int, default=42, help='Random seed for the data.')
+    run_parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='Compare two reports from run.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float,
+                                help='Exit with status 1 when p95 or throughput is this many percent '
+                                     'worse, or queries or errors went up.')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
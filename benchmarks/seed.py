@@ -0,0 +1,130 @@
+"""Deterministic benchmark data, written with a handful of bulk INSERTs.
+
+Users in the first half apply for jobs; the second half is kept free of
+applications so ``apply_job`` runs can submit new ones.
+"""
+import random
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
+from werkzeug.security import generate_password_hash
+
+from app import db, search
+from app.models import User, Company, Post, Job, JobApplication, JobApplicationStatus, followers
+from app.reference import reference_data
+
+
+PASSWORD = 'benchmark'
+
+TITLES = ['Python Developer', 'Data Analyst', 'Frontend Engineer', 'Accountant', 'Nurse',
+          'Project Manager', 'Teacher', 'Bus Captain', 'Site Engineer', 'Financial Controller',
+          'DevOps Engineer', 'Marketing Executive', 'Clinical Pharmacist', 'Logistics Officer']
+LEVELS = ['Junior', 'Senior', 'Lead', 'Graduate', '']
+WORDS = ('team experience customer reporting python sql cloud budget audit patient '
+         'classroom safety schedule design testing support planning english cantonese '
+         'mandarin degree certificate shift leadership analysis communication').split()
+
+DEFAULTS = {'users': 200, 'companies': 20, 'jobs': 2000, 'posts_per_user': 5,
+            'follows_per_user': 10, 'applications_per_user': 5}
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def seed(sizes=None, random_seed=42, now=None):
+    """Drop and recreate every table, then fill them. Needs an app context."""
+    sizes = dict(DEFAULTS, **(sizes or {}))
+    rng = random.Random(random_seed)
+    now = now or datetime(2024, 1, 1)
+
+    db.drop_all()
+    db.create_all()
+    reference_data.seed_defaults()
+    locations = list(reference_data.snapshot.locations)
+    categories = list(reference_data.snapshot.categories)
+    # One hash for everybody; hashing thousands of passwords would dominate seeding.
+    password_hash = generate_password_hash(PASSWORD, current_app.config['PASSWORD_HASH_METHOD'])
+
+    user_ids = list(range(1, sizes['users'] + 1))
+    follows = set()
+    for user_id in user_ids:
+        for followed in rng.sample(user_ids, min(sizes['follows_per_user'], len(user_ids))):
+            if followed != user_id:
+                follows.add((user_id, followed))
+    followers_count = {user_id: 0 for user_id in user_ids}
+    followed_count = dict(followers_count)
+    for follower, followed in follows:
+        followed_count[follower] += 1
+        followers_count[followed] += 1
+
+    db.session.execute(insert(User), [{
+        'id': user_id, 'username': 'user{}'.format(user_id), 'email': 'user{}@example.com'.format(user_id),
+        'password_hash': password_hash, 'about_me': _text(rng, 8), 'last_seen': now,
+        'followers_count': followers_count[user_id], 'followed_count': followed_count[user_id],
+    } for user_id in user_ids])
+    db.session.execute(insert(followers), [
+        {'follower_id': follower, 'followed_id': followed} for follower, followed in sorted(follows)])
+
+    posts = []
+    for user_id in user_ids:
+        for _ in range(sizes['posts_per_user']):
+            posts.append({'id': len(posts) + 1, 'user_id': user_id, 'body': _text(rng, 10)[:140],
+                          'timestamp': now - timedelta(minutes=rng.randrange(60 * 24 * 30))})
+    if posts:
+        db.session.execute(insert(Post), posts)
+        for post in db.session.scalars(select(Post).options(joinedload(Post.author))):
+            post.fan_out()
+
+    companies = [{'id': i, 'username': 'company{}'.format(i), 'name': 'Company {}'.format(i),
+                  'email': 'company{}@example.com'.format(i), 'password_hash': password_hash,
+                  'updated_at': now} for i in range(1, sizes['companies'] + 1)]
+    db.session.execute(insert(Company), companies)
+
+    jobs, documents = [], []
+    for job_id in range(1, sizes['jobs'] + 1):
+        company = companies[job_id % len(companies)]
+        job = {
+            'id': job_id, 'company_id': company['id'],
+            'title': ' '.join(filter(None, [rng.choice(LEVELS), rng.choice(TITLES)])),
+            'description': _text(rng, 60), 'requirement': _text(rng, 30),
+            'salary': rng.randrange(8000, 80000, 500) if rng.random() < 0.9 else None,
+            'location_id': rng.choice(locations), 'category_id': rng.choice(categories),
+            'available': rng.random() < 0.85,
+            'created_at': now - timedelta(minutes=rng.randrange(60 * 24 * 90)),
+        }
+        job['updated_at'] = job['created_at']
+        jobs.append(job)
+        heading, body = search.document_parts(job['title'], company['name'], job['description'], job['requirement'])
+        documents.append({'job_id': job_id, 'heading': heading, 'body': body})
+    db.session.execute(insert(Job), jobs)
+    search.index_documents(documents)
+
+    statuses = [status.value for status in JobApplicationStatus]
+    applications = []
+    for user_id in applicants(sizes):
+        for job in rng.sample(jobs, min(sizes['applications_per_user'], len(jobs))):
+            created_at = job['created_at'] + timedelta(minutes=rng.randrange(1, 60 * 24 * 7))
+            applications.append({
+                'job_id': job['id'], 'user_id': user_id, 'company_id': job['company_id'],
+                'name': 'User {}'.format(user_id), 'contact_number': 91234567,
+                'contact_email': 'user{}@example.com'.format(user_id), 'resume': _text(rng, 120),
+                'message': _text(rng, 20), 'status': rng.choice(statuses),
+                'created_at': created_at, 'updated_at': created_at,
+            })
+    if applications:
+        db.session.execute(insert(JobApplication), applications)
+    db.session.commit()
+    return sizes
+
+
+def applicants(sizes):
+    """Ids of the users that were seeded with applications."""
+    return range(1, sizes['users'] // 2 + 1)
+
+
+def newcomers(sizes):
+    """Ids of the users without any application."""
+    return range(sizes['users'] // 2 + 1, sizes['users'] + 1)
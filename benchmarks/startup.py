@@ -0,0 +1,78 @@
+"""Cold-start timings: each scenario runs in a fresh interpreter.
+
+    python benchmarks/startup.py --repeat 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # Bare interpreter, to subtract from the rest.
+    'python': 'pass',
+    'import': 'import app',
+    'create_app': 'from app import create_app; create_app()',
+    'cli': ['-m', 'flask', 'routes'],
+    'test_client': ('from app import create_app, db\n'
+                    'app = create_app()\n'
+                    'app.config["TESTING"] = True\n'
+                    'with app.app_context():\n'
+                    '    db.create_all()\n'
+                    'app.test_client().get("/login")'),
+}
+
+
+def run(scenario, env):
+    args = scenario if isinstance(scenario, list) else ['-c', scenario]
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def measure(names, repeat):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    env.setdefault('FLASK_DEBUG', '1')
+    results = {}
+    for name in names:
+        # One untimed run so the bytecode and OS file caches are warm.
+        run(SCENARIOS[name], env)
+        samples = [run(SCENARIOS[name], env) for _ in range(repeat)]
+        results[name] = {
+            'min_ms': round(min(samples) * 1000, 1),
+            'median_ms': round(statistics.median(samples) * 1000, 1),
+            'max_ms': round(max(samples) * 1000, 1),
+            'runs': repeat,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help='Any of {} (default: all).'.format(', '.join(SCENARIOS)))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the JSON results to this file.')
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenario: {}'.format(', '.join(sorted(unknown))))
+
+    results = {'benchmark': 'startup', 'python': sys.version.split()[0],
+               'scenarios': measure(args.scenarios or list(SCENARIOS), args.repeat)}
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
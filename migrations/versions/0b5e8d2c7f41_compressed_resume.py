@@ -0,0 +1,79 @@
+"""compressed resume
+
+Revision ID: 0b5e8d2c7f41
+Revises: f1d7a3b8c604
+Create Date: 2026-10-18 18:40:12.663018
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b5e8d2c7f41'
+down_revision = 'f1d7a3b8c604'
+branch_labels = None
+depends_on = None
+
+job_application = sa.table('job_application', sa.column('id', sa.Integer),
+                           sa.column('resume', sa.Text), sa.column('resume_blob', sa.LargeBinary))
+
+
+def _copy(convert, source, target, batch=1000):
+    # Row by row in batches; resumes are rewritten through Python so both
+    # directions work the same on every backend.
+    bind = op.get_bind()
+    last = 0
+    while True:
+        rows = bind.execute(sa.select(job_application.c.id, job_application.c[source])
+                            .where(job_application.c.id > last)
+                            .order_by(job_application.c.id).limit(batch)).all()
+        if not rows:
+            break
+        bind.execute(job_application.update().where(job_application.c.id == sa.bindparam('_id'))
+                     .values({target: sa.bindparam('_value')}),
+                     [{'_id': id, '_value': convert(value)} for id, value in rows])
+        last = rows[-1][0]
+
+
+def _encode(text):
+    return b'\x00' + (text or '').encode('utf-8')
+
+
+def _decode(blob):
+    blob = bytes(blob)
+    if blob[:1] == b'\x01':
+        return zlib.decompress(blob[1:]).decode('utf-8')
+    if blob[:1] == b'\x02':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(blob[1:]).decode('utf-8')
+    return blob[1:].decode('utf-8')
+
+
+def upgrade():
+    with op.batch_alter_table('job_application', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('resume_blob', sa.LargeBinary(), nullable=True))
+
+    _copy(_encode, 'resume', 'resume_blob')
+
+    with op.batch_alter_table('job_application', schema=None) as batch_op:
+        batch_op.drop_column('resume')
+        batch_op.alter_column('resume_blob', new_column_name='resume',
+                              existing_type=sa.LargeBinary(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job_application', schema=None) as batch_op:
+        batch_op.alter_column('resume', new_column_name='resume_blob',
+                              existing_type=sa.LargeBinary(), nullable=True)
+
+    with op.batch_alter_table('job_application', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('resume', sa.Text(), nullable=True))
+
+    _copy(_decode, 'resume_blob', 'resume')
+
+    with op.batch_alter_table('job_application', schema=None) as batch_op:
+        batch_op.drop_column('resume_blob')
+        batch_op.alter_column('resume', existing_type=sa.Text(), nullable=False)
@@ -0,0 +1,57 @@
+"""job search document
+
+Revision ID: 3f6a2c9d81b4
+Revises: 625198eacd18
+Create Date: 2026-10-18 09:12:41.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2c9d81b4'
+down_revision = '625198eacd18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_search_document',
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('heading', sa.Text(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['job.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    # Must produce exactly what app.search.document_parts does, so a later
+    # reindex leaves these rows unchanged.
+    op.execute(sa.text(
+        "INSERT INTO job_search_document (job_id, heading, body) "
+        "SELECT job.id, "
+        "CASE WHEN coalesce(company.name, '') = '' THEN job.title "
+        "ELSE job.title || ' ' || company.name END, "
+        "CASE WHEN coalesce(job.requirement, '') = '' THEN coalesce(job.description, '') "
+        "WHEN coalesce(job.description, '') = '' THEN job.requirement "
+        "ELSE job.description || :separator || job.requirement END "
+        "FROM job LEFT JOIN company ON company.id = job.company_id").bindparams(separator='\n'))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_job_search_document_vector ON job_search_document USING gin "
+            "((setweight(to_tsvector('english'::regconfig, coalesce(heading, '')), 'A') || "
+            "setweight(to_tsvector('english'::regconfig, coalesce(body, '')), 'D')))")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS job_fts USING fts5(heading, body)")
+        op.execute("INSERT INTO job_fts (rowid, heading, body) "
+                   "SELECT job_id, heading, body FROM job_search_document")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_job_search_document_vector")
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS job_fts")
+    op.drop_table('job_search_document')
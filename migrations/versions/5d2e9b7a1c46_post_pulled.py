@@ -0,0 +1,37 @@
+"""post pulled
+
+Revision ID: 5d2e9b7a1c46
+Revises: 0b5e8d2c7f41
+Create Date: 2026-10-18 20:15:37.402861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e9b7a1c46'
+down_revision = '0b5e8d2c7f41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pulled', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index('ix_post_user_pulled', ['user_id', 'pulled'], unique=False)
+
+    # Posts of followed authors that reached no follower's timeline were
+    # pulled at read time when they were written.
+    op.execute(sa.text(
+        "UPDATE post SET pulled = :pulled "
+        "WHERE EXISTS (SELECT 1 FROM followers WHERE followers.followed_id = post.user_id) "
+        "AND NOT EXISTS (SELECT 1 FROM timeline_entry "
+        "WHERE timeline_entry.post_id = post.id AND timeline_entry.user_id != post.user_id)")
+        .bindparams(pulled=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_user_pulled')
+        batch_op.drop_column('pulled')
@@ -0,0 +1,51 @@
+"""follower counters
+
+Revision ID: b52f0d6e93a7
+Revises: a4c7e9215f3d
+Create Date: 2026-10-18 13:02:48.114920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52f0d6e93a7'
+down_revision = 'a4c7e9215f3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop incomplete and duplicate edges so the pair can become the key.
+    op.execute("DELETE FROM followers WHERE follower_id IS NULL OR followed_id IS NULL")
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DELETE FROM followers a USING followers b WHERE a.ctid < b.ctid "
+                   "AND a.follower_id = b.follower_id AND a.followed_id = b.followed_id")
+    else:
+        op.execute("DELETE FROM followers WHERE rowid NOT IN ("
+                   "SELECT min(rowid) FROM followers GROUP BY follower_id, followed_id)")
+
+    with op.batch_alter_table('followers', schema=None) as batch_op:
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key('followers_pkey', ['follower_id', 'followed_id'])
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('followed_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute('UPDATE "user" SET '
+               'followers_count = (SELECT count(*) FROM followers WHERE followers.followed_id = "user".id), '
+               'followed_count = (SELECT count(*) FROM followers WHERE followers.follower_id = "user".id)')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('followed_count')
+        batch_op.drop_column('followers_count')
+
+    with op.batch_alter_table('followers', schema=None) as batch_op:
+        batch_op.drop_constraint('followers_pkey', type_='primary')
+        batch_op.alter_column('followed_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('follower_id', existing_type=sa.Integer(), nullable=True)
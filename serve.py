@@ -0,0 +1,94 @@
+"""Production entry point: runs the app under gunicorn's pre-fork server.
+
+The app is imported, migrated and seeded once in the master process and
+then forked into ``WEB_CONCURRENCY`` workers of ``WEB_THREADS`` threads
+each. ``kill -HUP <master>`` starts fresh workers and gracefully stops the
+old ones; with the app preloaded they fork from the code already in the
+master, so a code deploy needs a full restart (or ``USR2`` + ``QUIT``).
+"""
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import create_app, db
+from run import prepare
+
+
+logger = logging.getLogger('jobsbd.serve')
+
+app = create_app()
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def dispose_engines(close=True):
+    # close=False drops the pooled connections inherited from the master
+    # without closing sockets the master still owns.
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def post_fork(server, worker):
+    dispose_engines(close=False)
+
+
+def worker_exit(server, worker):
+    from app.presence import last_seen_buffer
+    last_seen_buffer.flush()
+
+
+def options():
+    cpus = cpu_count()
+    threads = int(os.environ.get('WEB_THREADS') or 2)
+    max_requests = int(os.environ.get('WEB_MAX_REQUESTS') or 1000)
+    return {
+        'bind': os.environ.get('WEB_BIND') or '0.0.0.0:5000',
+        'workers': int(os.environ.get('WEB_CONCURRENCY') or cpus * 2 + 1),
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'max_requests': max_requests,
+        'max_requests_jitter': int(os.environ.get('WEB_MAX_REQUESTS_JITTER') or max_requests // 10),
+        'timeout': int(os.environ.get('WEB_TIMEOUT') or 30),
+        'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT') or 30),
+        'keepalive': int(os.environ.get('WEB_KEEPALIVE') or 5),
+        'accesslog': os.environ.get('WEB_ACCESS_LOG') or '-',
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+
+class JobsBDServer(BaseApplication):
+    def __init__(self, application, options=None):
+        self.application = application
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    prepare(app)
+    # Nothing opened while migrating and seeding should reach the workers.
+    dispose_engines()
+    config = options()
+    logger.info('Starting %d workers x %d threads on %s',
+                config['workers'], config['threads'], config['bind'])
+    JobsBDServer(app, config).run()
+
+
+if __name__ == '__main__':
+    main()
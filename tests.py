@@ -1,3 +1,831 @@
+import io
+import json
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from flask import g, request, session
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+
+from app import compression, create_app, db, job_import, search
+from app.cache import TTLCache
+from app.config import Config
+from app.database import replica_router
+from app.email import dispatcher
+from app.forms import JobSearchForm
+from app.models import (Company, Job, JobApplication, JobApplicationStatus, JobSearchDocument, Location, Post,
+                        TimelineEntry, User, _load_identity, identity_cache)
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+from app.reference import reference_data
+from app.search import SORT_ORDERS
+from app.security import SlidingWindow, login_throttle
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+
+
+class AppTestCase(unittest.TestCase):
+    config = TestConfig
+
+    def setUp(self):
+        self.app = create_app(self.config)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        # Replicas mirror the primary; their bind has no tables of its own.
+        db.create_all(bind_key=None)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all(bind_key=None)
+        self.app_context.pop()
+
+    def add_company(self, name):
+        company = Company(username=name.lower(), name=name, email='{}@example.com'.format(name.lower()))
+        db.session.add(company)
+        db.session.flush()
+        return company
+
+    def add_job(self, company, title, description='Description.', requirement='Requirement.', **kwargs):
+        job = Job(company_id=company.id, title=title, description=description,
+                  requirement=requirement, **kwargs)
+        db.session.add(job)
+        db.session.flush()
+        job.publisher = company
+        search.index_job(job)
+        return job
+
+
+class SearchCase(AppTestCase):
+    def test_document_parts_skip_empty_parts(self):
+        self.assertEqual(search.document_parts('Nurse', 'Acme', 'Wards.', 'RN'), ('Nurse Acme', 'Wards.\nRN'))
+        self.assertEqual(search.document_parts('Nurse', '', '', 'RN'), ('Nurse', 'RN'))
+
+    def test_heading_matches_rank_first(self):
+        acme = self.add_company('Acme')
+        in_body = self.add_job(acme, 'Accountant', description='Keeps the python ledger.')
+        in_title = self.add_job(acme, 'Python Developer')
+        self.add_job(acme, 'Nurse')
+        db.session.commit()
+
+        query, keys = search.search_jobs(Job.query, 'python', 'relevance')
+        order = [expr.desc() if desc else expr.asc() for expr, desc in keys]
+        self.assertEqual(query.order_by(*order).all(), [in_title, in_body])
+
+    def test_no_terms_sorts_by_newest(self):
+        acme = self.add_company('Acme')
+        now = datetime(2024, 1, 1)
+        old = self.add_job(acme, 'Nurse', updated_at=now - timedelta(days=1))
+        new = self.add_job(acme, 'Teacher', updated_at=now)
+        db.session.commit()
+
+        query, keys = search.search_jobs(Job.query, '  ', 'relevance')
+        self.assertEqual(keys[0][0], Job.updated_at)
+        self.assertEqual(query.order_by(Job.updated_at.desc()).all(), [new, old])
+
+
+class KeysetPaginationCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        acme = self.add_company('Acme')
+        now = datetime(2024, 1, 1)
+        salaries = [30000, None, 12000, 30000, None, 45000, 12000, 8000, 30000]
+        for i, salary in enumerate(salaries):
+            # Pairs of jobs share a timestamp and some share a salary, so the id has to break ties.
+            self.add_job(acme, 'Engineer {}'.format(i), description='engineer ' * (i % 4 + 1),
+                         salary=salary, updated_at=now - timedelta(hours=i // 2))
+        db.session.commit()
+
+    def walk(self, query, keys, per_page=2):
+        pages = [keyset_paginate(query, keys, per_page)]
+        while pages[-1].has_next:
+            pages.append(keyset_paginate(query, keys, per_page, after=pages[-1].next_cursor))
+        return pages
+
+    def test_cursor_round_trip(self):
+        values = [datetime(2024, 1, 1, 12, 30, 15, 123456), None, 30000, -1.2345678901234567e-06, 0.1 + 0.2]
+        self.assertEqual(decode_cursor(encode_cursor(values), len(values)), values)
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = encode_cursor([1, 2])
+        for bad in ('not a cursor!', cursor[:-2]):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(bad, 2)
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor, 3)
+
+    def test_every_sort_order_pages_like_one_query(self):
+        for terms in ('', 'engineer'):
+            for sort, _ in SORT_ORDERS:
+                with self.subTest(terms=terms, sort=sort):
+                    query, keys = search.search_jobs(Job.query, terms, sort)
+                    expected = keyset_paginate(query, keys, 100).items
+                    pages = self.walk(query, keys)
+                    self.assertEqual([job for page in pages for job in page.items], expected)
+                    self.assertFalse(pages[0].has_prev)
+                    for previous, page in zip(pages, pages[1:]):
+                        back = keyset_paginate(query, keys, 2, before=page.prev_cursor)
+                        self.assertEqual(back.items, previous.items)
+
+    def test_sort_orders(self):
+        jobs = Job.query.all()
+        disclosed = [job for job in jobs if job.salary is not None]
+        expected = {
+            'newest': sorted(jobs, key=lambda job: (job.updated_at, job.id), reverse=True),
+            'salary_high': sorted(disclosed, key=lambda job: (job.salary, job.id), reverse=True),
+            'salary_low': sorted(disclosed, key=lambda job: (job.salary, job.id)),
+        }
+        for sort, jobs in expected.items():
+            with self.subTest(sort=sort):
+                query, keys = search.search_jobs(Job.query, '', sort)
+                self.assertEqual([job for page in self.walk(query, keys) for job in page.items], jobs)
+
+    def test_float_rank_cursor(self):
+        query, keys = search.search_jobs(Job.query, 'engineer', 'relevance')
+        page = keyset_paginate(query, keys, 3)
+        rank = decode_cursor(page.next_cursor, 2)[0]
+        self.assertIsInstance(rank, float)
+        rest = keyset_paginate(query, keys, 100, after=page.next_cursor).items
+        self.assertEqual(len(page.items) + len(rest), Job.query.count())
+        self.assertFalse(set(page.items) & set(rest))
+
+    def test_mixed_directions(self):
+        query = Job.query.filter(Job.salary.isnot(None))
+        keys = [(Job.salary, True), (Job.id, False)]
+        jobs = sorted(query.all(), key=lambda job: (-job.salary, job.id))
+        self.assertEqual([job for page in self.walk(query, keys) for job in page.items], jobs)
+
+
+class TimelineCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['TIMELINE_FANOUT_LIMIT'] = 1
+        self.john, self.susan, self.mary = [User(username=name, email='{}@example.com'.format(name))
+                                            for name in ('john', 'susan', 'mary')]
+        db.session.add_all([self.john, self.susan, self.mary])
+        db.session.commit()
+        self.now = datetime(2024, 1, 1)
+
+    def post(self, author, minutes):
+        post = Post(body='post from {}'.format(author.username), author=author,
+                    timestamp=self.now + timedelta(minutes=minutes))
+        db.session.add(post)
+        db.session.flush()
+        post.fan_out()
+        db.session.commit()
+        return post
+
+    def follow(self, follower, followed):
+        follower.follow(followed)
+        db.session.commit()
+        db.session.refresh(followed)
+
+    def entries(self, user):
+        return {entry.post_id for entry in TimelineEntry.query.filter_by(user_id=user.id)}
+
+    def test_fan_out_writes_every_follower(self):
+        self.follow(self.john, self.susan)
+        post = self.post(self.susan, 1)
+        self.assertFalse(post.pulled)
+        self.assertEqual(self.entries(self.john), {post.id})
+        self.assertEqual(self.entries(self.susan), {post.id})
+        self.assertEqual(self.john.followed_posts().all(), [post])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        old = self.post(self.susan, 1)
+        self.follow(self.john, self.susan)
+        self.assertEqual(self.entries(self.john), {old.id})
+        self.john.unfollow(self.susan)
+        db.session.commit()
+        self.assertEqual(self.john.followed_posts().all(), [])
+
+    def test_heavy_author_is_pulled_at_read_time(self):
+        self.follow(self.john, self.susan)
+        self.follow(self.mary, self.susan)
+        own = self.post(self.john, 1)
+        heavy = self.post(self.susan, 2)
+        self.assertTrue(heavy.pulled)
+        self.assertEqual(self.entries(self.john), {own.id})
+        self.assertEqual(self.john.followed_posts().all(), [heavy, own])
+        self.assertEqual(self.mary.followed_posts().all(), [heavy])
+
+    def test_pulled_posts_survive_dropping_under_the_limit(self):
+        self.follow(self.john, self.susan)
+        self.follow(self.mary, self.susan)
+        pulled = self.post(self.susan, 1)
+        self.mary.unfollow(self.susan)
+        db.session.commit()
+        db.session.refresh(self.susan)
+        self.assertFalse(self.susan.is_heavy_poster())
+        fanned = self.post(self.susan, 2)
+        self.assertEqual(self.john.followed_posts().all(), [fanned, pulled])
+
+    def test_posts_fanned_out_before_crossing_the_limit_stay(self):
+        self.follow(self.john, self.susan)
+        fanned = self.post(self.susan, 1)
+        self.follow(self.mary, self.susan)
+        pulled = self.post(self.susan, 2)
+        self.assertEqual(self.john.followed_posts().all(), [pulled, fanned])
+        # A new follower gets the fanned out post backfilled and the pulled one at read time.
+        self.assertEqual(self.mary.followed_posts().all(), [pulled, fanned])
+
+
+class TTLCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=20)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 2)
+        self.now = 20
+        self.assertEqual(self.cache.get('b', 'gone'), 'gone')
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((self.cache.get('a'), self.cache.get('c')), (1, 3))
+
+    def test_zero_size_disables(self):
+        cache = TTLCache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class IdentityCacheCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='susan', email='susan@example.com', password_hash='old')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+
+    def test_update_drops_cached_identity(self):
+        _load_identity(User, self.user_id)
+        self.assertIsNotNone(identity_cache.get('user.{}'.format(self.user_id)))
+        db.session.remove()
+
+        user = _load_identity(User, self.user_id)
+        user.about_me = 'Hello'
+        db.session.commit()
+        self.assertIsNone(identity_cache.get('user.{}'.format(self.user_id)))
+        db.session.remove()
+        self.assertEqual(_load_identity(User, self.user_id).about_me, 'Hello')
+
+    def test_password_hash_is_not_cached(self):
+        _load_identity(User, self.user_id)
+        self.assertNotIn('password_hash', identity_cache.get('user.{}'.format(self.user_id)))
+        db.session.remove()
+        # Changed by another worker, whose eviction never reaches this process.
+        db.session.execute(db.update(User).values(password_hash='new'))
+        db.session.commit()
+        db.session.remove()
+        self.assertEqual(_load_identity(User, self.user_id).password_hash, 'new')
+
+
+class PasswordResetMailCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        db.session.add(User(username='susan', email='susan@example.com'))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def request_reset(self, accepted):
+        # Only the queueing is under test, not the token.
+        with mock.patch.object(User, 'get_reset_password_token', return_value='token'), \
+                mock.patch.object(dispatcher, 'submit', return_value=accepted) as submit:
+            response = self.client.post('/reset_password_request', data={'email': 'susan@example.com'})
+        self.assertEqual(submit.call_args.args[0].recipients, ['susan@example.com'])
+        return response
+
+    def test_queued(self):
+        response = self.request_reset(True)
+        self.assertEqual(response.status_code, 302)
+
+    def test_full_queue_is_reported(self):
+        response = self.request_reset(False)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(b'We could not send the email right now.', response.data)
+
+
+class FacetCountsCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.acme = self.add_company('Acme')
+        for location_id, category_id, available, salary in ((1, 1, True, 9000), (1, 2, True, 25000),
+                                                             (2, 1, False, None), (2, 1, True, 60000)):
+            self.add_job(self.acme, 'Engineer', location_id=location_id, category_id=category_id,
+                         available=available, salary=salary)
+        db.session.commit()
+
+    def test_grouped_counts(self):
+        counts = search.facet_counts({'terms': 'engineer'})
+        self.assertEqual(counts['location'], {1: 2, 2: 2})
+        self.assertEqual(counts['category'], {1: 3, 2: 1})
+        self.assertEqual(counts['available'], {True: 3, False: 1})
+        self.assertEqual(counts['salary'], {0: 1, 2: 1, 4: 1, None: 1})
+
+    def test_other_selections_apply(self):
+        counts = search.facet_counts({'terms': 'engineer', 'location': 2, 'available': True})
+        # Each dimension ignores its own selection and applies the others.
+        self.assertEqual(counts['location'], {1: 2, 2: 1})
+        self.assertEqual(counts['available'], {True: 1, False: 1})
+        self.assertEqual(counts['category'], {1: 1})
+        counts = search.facet_counts({'terms': 'engineer', 'min_salary': 20000})
+        self.assertEqual(counts['location'], {1: 1, 2: 1})
+
+    def test_job_writes_invalidate_the_cache(self):
+        self.assertEqual(search.facet_counts({})['location'], {1: 2, 2: 2})
+        self.assertGreater(search.facet_cache.stats()['size'], 0)
+        self.add_job(self.acme, 'Nurse', location_id=3, category_id=1, available=True)
+        db.session.commit()
+        self.assertEqual(search.facet_counts({})['location'], {1: 2, 2: 2, 3: 1})
+        job = Job.query.filter_by(location_id=3).one()
+        job.location_id = 1
+        db.session.commit()
+        self.assertEqual(search.facet_counts({})['location'], {1: 3, 2: 2})
+
+
+class SalaryFilterCase(AppTestCase):
+    def search_form(self, **args):
+        with self.app.test_request_context('/job_search', query_string=args):
+            form = JobSearchForm(formdata=request.args, meta={'csrf': False})
+            form.validate()
+            return form
+
+    def test_min_above_max_is_rejected(self):
+        form = self.search_form(search='nurse', min_salary='30000', max_salary='20000')
+        self.assertIn('Maximum salary must not be below the minimum.', form.max_salary.errors)
+
+    def test_valid_ranges(self):
+        for args in ({'min_salary': '20000', 'max_salary': '20000'}, {'min_salary': '20000'}, {'max_salary': '0'}):
+            with self.subTest(**args):
+                self.assertEqual(self.search_form(search='nurse', **args).max_salary.errors, [])
+        self.assertTrue(self.search_form(min_salary='-1').min_salary.errors)
+
+    def test_range_is_inclusive_and_skips_undisclosed(self):
+        acme = self.add_company('Acme')
+        jobs = [self.add_job(acme, 'Job {}'.format(salary), salary=salary) for salary in (10000, 20000, 30000, None)]
+        db.session.commit()
+        matched = search.filter_jobs(Job.query, {'min_salary': 10000, 'max_salary': 20000}).order_by(Job.id).all()
+        self.assertEqual(matched, jobs[:2])
+
+    def test_histogram_buckets(self):
+        acme = self.add_company('Acme')
+        for salary, category_id in ((9999, 1), (10000, 1), (19999, 2), (50000, 2), (None, 2)):
+            self.add_job(acme, 'Job', salary=salary, category_id=category_id)
+        db.session.commit()
+        self.assertEqual([count for _, _, count, _ in search.salary_histogram()], [1, 2, 0, 0, 1])
+        histogram = search.salary_histogram(2)
+        self.assertEqual([count for _, _, count, _ in histogram], [0, 1, 0, 0, 1])
+        self.assertEqual(histogram[1][:2], ('10,000 - 20,000', {'min_salary': 10000, 'max_salary': 19999}))
+        self.assertEqual(histogram[-1][1], {'min_salary': 50000, 'max_salary': None})
+
+
+class ConditionalCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        reference_data.seed_defaults()
+        acme = self.add_company('Acme')
+        self.job_id = self.add_job(acme, 'Nurse', location_id=1, category_id=1,
+                                   updated_at=datetime(2024, 1, 1)).id
+        acme.updated_at = datetime(2023, 6, 1)
+        db.session.add(User(username='susan', email='susan@example.com'))
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.url = '/jobs/{}'.format(self.job_id)
+
+    def get(self, **headers):
+        # Its own app context, so g and the signed-in user are not kept from the last request.
+        with self.app.app_context():
+            return self.client.get(self.url, headers=headers)
+
+    def test_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cookie', response.vary)
+        self.assertTrue(response.cache_control.public)
+        self.assertEqual(response.last_modified, datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+        cached = self.get(**{'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.data, b'')
+        self.assertEqual(cached.headers['ETag'], response.headers['ETag'])
+
+    def test_if_modified_since_alone_is_not_enough(self):
+        response = self.get(**{'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_miss(self):
+        etag = self.get().headers['ETag']
+        # Within the same second as the stored timestamp.
+        db.session.get(Job, self.job_id).updated_at = datetime(2024, 1, 1, 0, 0, 0, 500000)
+        db.session.commit()
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 200)
+
+        etag = self.get().headers['ETag']
+        db.session.get(Location, 1).location = 'Renamed'
+        db.session.commit()
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 200)
+
+    def test_viewer_is_part_of_the_etag(self):
+        etag = self.get().headers['ETag']
+        with self.client.session_transaction() as s:
+            s['_user_id'] = 'user.1'
+            s['type'] = 'user'
+            s['_fresh'] = True
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.private)
+        self.assertTrue(response.cache_control.no_cache)
+        self.assertEqual(self.get(**{'If-None-Match': response.headers['ETag']}).status_code, 304)
+
+
+class JobsApiCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        reference_data.seed_defaults()
+        acme = self.add_company('Acme')
+        now = datetime(2024, 1, 1)
+        for i in range(5):
+            self.add_job(acme, 'Nurse' if i % 2 else 'Engineer', location_id=1, category_id=2,
+                         salary=20000 + i * 1000, available=True, updated_at=now - timedelta(hours=i))
+        db.session.commit()
+        self.app.config['API_EXPORT_BATCH_SIZE'] = 2
+        self.client = self.app.test_client()
+
+    def test_cursor_round_trip(self):
+        response = self.client.get('/api/v1/jobs?sort=newest&limit=2')
+        pages = [response.get_json()]
+        while pages[-1]['links']['next']:
+            pages.append(self.client.get(pages[-1]['links']['next']).get_json())
+        self.assertEqual([job['id'] for page in pages for job in page['data']], [1, 2, 3, 4, 5])
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['prev_cursor'])
+        back = self.client.get(pages[2]['links']['prev']).get_json()
+        self.assertEqual(back['data'], pages[1]['data'])
+        self.assertIn('sort=newest', back['links']['next'])
+
+    def test_json_shape(self):
+        job = self.client.get('/api/v1/jobs?q=nurse&limit=1').get_json()['data'][0]
+        self.assertEqual(set(job), {'id', 'title', 'description', 'requirement', 'salary', 'available', 'location',
+                                    'category', 'company', 'created_at', 'updated_at', 'url'})
+        self.assertEqual(job['title'], 'Nurse')
+        self.assertEqual(job['location'], {'id': 1, 'name': reference_data.location(1)})
+        self.assertEqual(job['category']['id'], 2)
+        self.assertEqual(job['company'], {'username': 'acme', 'name': 'Acme'})
+        self.assertTrue(job['updated_at'].endswith('Z'))
+        self.assertTrue(job['url'].endswith('/jobs/{}'.format(job['id'])))
+
+    def test_bad_arguments(self):
+        for query, error in (('after=garbage', 'invalid cursor'), ('sort=oldest', None),
+                             ('min_salary=5&max_salary=1', 'max_salary must not be below min_salary'),
+                             ('limit=abc', 'limit must be an integer'), ('available=maybe', None)):
+            with self.subTest(query=query):
+                response = self.client.get('/api/v1/jobs?' + query)
+                self.assertEqual(response.status_code, 400)
+                if error:
+                    self.assertEqual(response.get_json(), {'error': error})
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get('/api/v1/jobs/export?min_salary=21000')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        jobs = [json.loads(line) for line in lines]
+        self.assertEqual([job['id'] for job in jobs], [2, 3, 4, 5])
+        self.assertEqual(jobs[0], self.client.get('/api/v1/jobs?sort=salary_low&min_salary=21000&limit=1')
+                         .get_json()['data'][0])
+
+    def test_export_matches_terms(self):
+        lines = self.client.get('/api/v1/jobs/export?q=engineer').get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [1, 3, 5])
+
+
+class JobImportCase(AppTestCase):
+    CSV = ('title,description,requirement,salary,location,category,available\n'
+           'Python Developer,Build APIs.,Python,30000,Kowloon Peninsula,information technology,yes\n'
+           'Nurse,Ward duties.,RN,,2,Healthcare,\n'
+           ',No title.,None,,1,1,yes\n'
+           'Teacher,Classes.,Degree,lots,1,Education,no\n'
+           'Driver,Routes.,Licence,20000,Mars,Transportation,no\n'
+           'Accountant,Books.,CPA,25000,Hong Kong Island,Finance,no\n')
+
+    def setUp(self):
+        super().setUp()
+        reference_data.seed_defaults()
+        self.acme = self.add_company('Acme')
+        db.session.commit()
+
+    def run_import(self, data, fmt='csv', **kwargs):
+        return job_import.import_jobs(self.acme, io.StringIO(data), fmt, **kwargs)
+
+    def test_validation_errors_are_reported_by_line(self):
+        report = self.run_import(self.CSV)
+        self.assertEqual((report.imported, report.rejected), (3, 3))
+        self.assertEqual(report.errors, [(4, 'title is required'), (5, 'salary must be a whole number'),
+                                         (6, "unknown location 'Mars'")])
+        nurse = Job.query.filter_by(title='Nurse').one()
+        self.assertEqual((nurse.salary, nurse.location_id, nurse.available), (None, 2, True))
+        self.assertEqual(Job.query.filter_by(title='Accountant').one().available, False)
+
+    def test_rows_are_written_in_batches_and_indexed(self):
+        insert_rows, sizes = job_import._insert_rows, []
+
+        def record(company, rows):
+            sizes.append(len(rows))
+            insert_rows(company, rows)
+
+        with mock.patch.object(job_import, '_insert_rows', side_effect=record):
+            report = self.run_import(self.CSV, batch_size=2)
+        self.assertEqual(report.imported, 3)
+        self.assertEqual(sizes, [2, 1])
+        query, keys = search.search_jobs(Job.query, 'python', 'relevance')
+        self.assertEqual([job.title for job in query], ['Python Developer'])
+        self.assertEqual(db.session.get(JobSearchDocument, query.one().id).heading, 'Python Developer Acme')
+
+    def test_import_invalidates_facets(self):
+        self.assertEqual(search.facet_counts({})['location'], {})
+        self.run_import(self.CSV)
+        self.assertEqual(search.facet_counts({})['location'], {1: 1, 2: 2})
+
+    def test_jsonl_and_missing_columns(self):
+        data = ('{"title": "Nurse", "description": "Wards.", "requirement": "RN", "location": 1, '
+                '"category": 6, "available": false}\n\nnot json\n[1, 2]\n')
+        report = self.run_import(data, 'jsonl')
+        self.assertEqual(report.imported, 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertTrue(report.errors[0].message.startswith('invalid JSON'))
+        self.assertEqual(report.errors[1].message, 'expected a JSON object')
+
+        report = self.run_import('title,description\nNurse,Wards.\n')
+        self.assertEqual(report.errors, [(1, 'missing columns: requirement, location, category')])
+
+    def test_dry_run_writes_nothing(self):
+        report = self.run_import(self.CSV, dry_run=True)
+        self.assertEqual((report.imported, report.rejected), (3, 3))
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_failed_batch_is_rejected_and_rolled_back(self):
+        insert_rows, calls = job_import._insert_rows, []
+
+        def fail_second(company, rows):
+            calls.append(len(rows))
+            insert_rows(company, rows)
+            if len(calls) == 2:
+                raise ValueError('boom')
+
+        with mock.patch.object(job_import, '_insert_rows', side_effect=fail_second):
+            with self.assertLogs(self.app.logger, 'ERROR'):
+                report = self.run_import(self.CSV, batch_size=2)
+        self.assertEqual((report.imported, report.rejected), (2, 4))
+        self.assertIn((7, 'could not be saved: ValueError'), report.errors)
+        self.assertEqual(Job.query.count(), 2)
+
+
+class BulkTransitionCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        acme, other = self.add_company('Acme'), self.add_company('Other')
+        self.acme_id = acme.id
+        user = User(username='susan', email='susan@example.com')
+        db.session.add(user)
+        db.session.flush()
+        self.own_job = self.add_job(acme, 'Nurse')
+        self.other_job = self.add_job(other, 'Teacher')
+        self.own = [self.apply(user, self.own_job), self.apply(user, self.own_job)]
+        self.other = self.apply(user, self.other_job)
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as s:
+            s['_user_id'] = acme.get_id()
+            s['type'] = 'company'
+            s['_fresh'] = True
+
+    def apply(self, user, job):
+        application = JobApplication(job_id=job.id, user_id=user.id, company_id=job.company_id, name='Susan',
+                                     contact_number=91234567, contact_email=user.email, resume='Resume.',
+                                     status=JobApplicationStatus.submitted.value)
+        db.session.add(application)
+        db.session.flush()
+        return application.id
+
+    def statuses(self):
+        db.session.expire_all()
+        return {a.id: a.status for a in JobApplication.query}
+
+    def test_another_companys_job_is_rejected(self):
+        response = self.client.post('/applications/bulk', data={
+            'scope': 'matching', 'job': str(self.other_job.id), 'status': 'All',
+            'new_status': JobApplicationStatus.rejected.value, 'submit': 'Apply'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Not a valid choice', response.data)
+        self.assertEqual(set(self.statuses().values()), {JobApplicationStatus.submitted.value})
+
+    def test_selected_ids_are_scoped_to_the_company(self):
+        response = self.client.post('/applications/bulk', data={
+            'scope': 'selected', 'application_ids': [self.own[0], self.other], 'job': 'All', 'status': 'All',
+            'new_status': JobApplicationStatus.reviewed.value, 'submit': 'Apply'})
+        self.assertEqual(response.status_code, 302)
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.own[0]], JobApplicationStatus.reviewed.value)
+        self.assertEqual(statuses[self.own[1]], JobApplicationStatus.submitted.value)
+        self.assertEqual(statuses[self.other], JobApplicationStatus.submitted.value)
+
+    def test_preview_and_unchanged_rows(self):
+        query = JobApplication.query.filter_by(company_id=self.acme_id)
+        reviewed = JobApplicationStatus.reviewed.value
+        self.assertEqual(JobApplication.bulk_transition(query, reviewed, dry_run=True), 2)
+        self.assertEqual(set(self.statuses().values()), {JobApplicationStatus.submitted.value})
+        self.assertEqual(JobApplication.bulk_transition(query, reviewed), 2)
+        self.assertEqual(JobApplication.bulk_transition(query, reviewed), 0)
+        self.assertEqual(JobApplication.bulk_transition(query, reviewed, reply='Thanks'), 2)
+
+
+class CompressionCase(AppTestCase):
+    TEXT = 'Experienced nurse, fluent in English and Cantonese. ' * 20
+
+    def test_round_trip(self):
+        for method in ('none', 'zlib', 'zstd'):
+            with self.subTest(method=method):
+                blob = compression.compress(self.TEXT, method)
+                self.assertEqual(compression.decompress(blob), self.TEXT)
+
+    def test_headers(self):
+        self.assertEqual(compression.compress(self.TEXT, 'zlib')[:1], compression.ZLIB)
+        self.assertEqual(compression.compress(self.TEXT, 'none'), compression.RAW + self.TEXT.encode('utf-8'))
+        # Too short to be worth compressing, and incompressible, both stay raw.
+        self.assertEqual(compression.compress('Short résumé', 'zlib'), compression.RAW + 'Short résumé'.encode('utf-8'))
+        self.assertEqual(compression.compress('ab', 'zlib', min_size=0), compression.RAW + b'ab')
+        self.assertEqual(compression.decompress(compression.RAW + b''), '')
+
+    def test_legacy_and_unknown_values(self):
+        self.assertEqual(compression.decompress('Stored as text'), 'Stored as text')
+        with self.assertRaises(ValueError):
+            compression.decompress(b'\x09data')
+
+    def test_column_follows_config(self):
+        acme = self.add_company('Acme')
+        job = self.add_job(acme, 'Nurse')
+        user = User(username='susan', email='susan@example.com')
+        db.session.add(user)
+        db.session.flush()
+        for setting in ('zlib', 'none'):
+            self.app.config['RESUME_COMPRESSION'] = setting
+            db.session.add(JobApplication(job_id=job.id, user_id=user.id, company_id=acme.id, name='Susan',
+                                          contact_number=91234567, contact_email=user.email,
+                                          resume=self.TEXT, status=JobApplicationStatus.submitted.value))
+            db.session.flush()
+        db.session.commit()
+        stored = db.session.execute(db.text('SELECT resume FROM job_application ORDER BY id')).scalars().all()
+        self.assertEqual([bytes(blob[:1]) for blob in stored], [compression.ZLIB, compression.RAW])
+        db.session.remove()
+        self.assertEqual([a.resume for a in JobApplication.query], [self.TEXT, self.TEXT])
+
+
+class SlidingWindowCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.window = SlidingWindow(limit=3, window=60, maxsize=2, clock=lambda: self.now)
+
+    def test_limit_and_expiry(self):
+        for _ in range(2):
+            self.window.hit('a')
+            self.now += 10
+        self.assertEqual(self.window.retry_after('a'), 0)
+        self.window.hit('a')
+        # The first hit, at 100, leaves the window at 160.
+        self.assertEqual(self.window.retry_after('a'), 41)
+        self.now = 160
+        self.assertEqual(self.window.retry_after('a'), 0)
+
+    def test_reset_and_eviction(self):
+        for _ in range(3):
+            self.window.hit('a')
+        self.window.reset('a')
+        self.assertEqual(self.window.retry_after('a'), 0)
+        for key in ('a', 'b', 'c'):
+            for _ in range(3):
+                self.window.hit(key)
+        self.assertEqual(self.window.retry_after('a'), 0)
+        self.assertGreater(self.window.retry_after('c'), 0)
+
+
+class LoginThrottleCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config.update(LOGIN_ACCOUNT_LIMIT=2, LOGIN_IP_LIMIT=5)
+        login_throttle.init_app(self.app)
+        db.session.add(User(username='susan', email='susan@example.com',
+                            password_hash=generate_password_hash('cat', self.app.config['PASSWORD_HASH_METHOD'])))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def login(self, username, password):
+        return self.client.post('/login', data={'username': username, 'password': password})
+
+    def test_account_failures(self):
+        for _ in range(2):
+            self.assertEqual(self.login('susan', 'dog').status_code, 302)
+        response = self.login('Susan', 'cat')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+        self.assertEqual(self.login('john', 'dog').status_code, 302)
+
+    def test_success_resets_failures(self):
+        self.assertEqual(self.login('susan', 'dog').status_code, 302)
+        self.assertEqual(self.login('susan', 'cat').status_code, 302)
+        self.client.get('/logout')
+        self.assertEqual(self.login('susan', 'dog').status_code, 302)
+        self.assertEqual(self.login('susan', 'dog').status_code, 302)
+
+    def test_attempts_per_address(self):
+        for i in range(5):
+            self.assertEqual(self.login('user{}'.format(i), 'dog').status_code, 302)
+        self.assertEqual(self.login('susan', 'cat').status_code, 429)
+
+
+class ReplicaConfig(TestConfig):
+    SQLALCHEMY_REPLICA_URIS = ['sqlite://']
+    REPLICA_LAG_CHECK_INTERVAL = 0
+
+
+class ReplicaCase(AppTestCase):
+    config = ReplicaConfig
+
+    def setUp(self):
+        super().setUp()
+        self.replica = db.engines['replica_0']
+        db.metadata.create_all(self.replica)
+        db.session.add(Company(username='acme', name='Primary', email='acme@example.com'))
+        db.session.commit()
+        with self.replica.begin() as connection:
+            connection.execute(db.insert(Company), {'username': 'acme', 'name': 'Replica', 'email': 'acme@example.com'})
+
+    @contextmanager
+    def request(self, read_only=True):
+        # A new app context too, so g starts empty as it does in a real request.
+        with self.app.app_context(), self.app.test_request_context():
+            g.read_only = read_only
+            yield
+
+    def company_name(self):
+        return Company.query.filter_by(username='acme').one().name
+
+    def test_read_only_views_use_the_replica(self):
+        with self.request():
+            self.assertEqual(self.company_name(), 'Replica')
+        with self.request(read_only=False):
+            self.assertEqual(self.company_name(), 'Primary')
+        response = self.app.test_client().get('/company/acme')
+        self.assertIn(b'Replica', response.data)
+
+    def test_writes_go_to_the_primary(self):
+        with self.request():
+            db.session.add(Company(username='other', name='Other', email='other@example.com'))
+            db.session.commit()
+            # Once the request has written it reads its own writes.
+            self.assertEqual(self.company_name(), 'Primary')
+            self.assertTrue(g.db_wrote)
+            self.app.process_response(self.app.response_class())
+            self.assertIn('_db_last_write', session)
+        with self.replica.connect() as connection:
+            self.assertEqual(connection.execute(db.select(db.func.count()).select_from(Company)).scalar(), 1)
+        with self.request(read_only=False):
+            self.assertEqual(Company.query.count(), 2)
+
+    def test_sticky_after_a_write(self):
+        with self.request():
+            session['_db_last_write'] = int(time.time())
+            self.assertEqual(self.company_name(), 'Primary')
+        with self.request():
+            session['_db_last_write'] = int(time.time()) - self.app.config['REPLICA_STICKY_SECONDS'] - 1
+            self.assertEqual(self.company_name(), 'Replica')
+
+    def test_lagging_or_broken_replica_falls_back(self):
+        with mock.patch.object(replica_router, 'lag', return_value=self.app.config['REPLICA_MAX_LAG'] + 1):
+            with self.assertLogs('app.database', 'WARNING'), self.request():
+                self.assertEqual(self.company_name(), 'Primary')
+        with mock.patch.object(replica_router, 'lag', side_effect=OperationalError('SELECT', {}, None)):
+            with self.assertLogs('app.database', 'ERROR'), self.request():
+                self.assertEqual(self.company_name(), 'Primary')
+        with self.request():
+            self.assertEqual(self.company_name(), 'Replica')
+
+
 # import os
 # os.environ['DATABASE_URL'] = 'sqlite://'
 
@@ -91,4 +919,7 @@
 #         self.assertEqual(f4, [p4])
 
 # if __name__ == '__main__':
-#     unittest.main(verbosity=2)
\ No newline at end of file
+#     unittest.main(verbosity=2)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)